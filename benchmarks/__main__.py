@@ -0,0 +1,159 @@
+import asyncio
+import json
+import subprocess
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from loguru import logger
+
+from .fakes import FakeREST
+from .fixtures import reset_state, use_database
+from .scenarios import MEASUREMENTS, MONGO_SCENARIOS, SCENARIOS
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict:
+    return {
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'elapsed_s': elapsed,
+    }
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def run(args) -> Dict[str, Dict]:
+    results = {}
+
+    for name in args.scenario:
+        reset_state()
+        rest = FakeREST(
+            latency=args.latency, rate_limit_chance=args.rate_limit_chance
+        )
+
+        logger.info(f'Running {name}')
+        latencies, elapsed = await SCENARIOS[name](rest, args.scale)
+
+        results[name] = summarize(latencies, elapsed)
+        results[name]['rest_calls'] = sum(rest.calls.values())
+        results[name]['rate_limited'] = rest.rate_limited
+        results[name]['measurements'] = dict(MEASUREMENTS)
+        MEASUREMENTS.clear()
+
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline_path: Path):
+    baseline = json.loads(baseline_path.read_text())['results']
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        for metric in ('p50_ms', 'p99_ms', 'throughput'):
+            before = baseline[name][metric]
+            after = result[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            print(
+                f'{name:28} {metric:10} {before:12.3f} -> {after:12.3f} '
+                f'({change:+.1f}%)'
+            )
+
+
+def main():
+    parser = ArgumentParser(
+        prog='python -m benchmarks',
+        description='Run Blockbot scenarios against a fake Discord client',
+    )
+    parser.add_argument(
+        '-s',
+        '--scenario',
+        action='append',
+        choices=sorted(SCENARIOS),
+        help='scenario to run (repeatable, defaults to all that can run)',
+    )
+    parser.add_argument(
+        '--mongo',
+        metavar='HOST',
+        help='MongoDB URI to use instead of mongomock',
+    )
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.05,
+        help='simulated REST latency in seconds',
+    )
+    parser.add_argument(
+        '--rate-limit-chance',
+        type=float,
+        default=0.0,
+        help='chance of each REST call being rate limited',
+    )
+    parser.add_argument(
+        '-o', '--output', type=Path, default=Path('bench_results.json')
+    )
+    parser.add_argument(
+        '--compare',
+        type=Path,
+        metavar='RESULTS',
+        help='earlier results file to compare against',
+    )
+    args = parser.parse_args()
+
+    if not args.scenario:
+        args.scenario = [
+            name
+            for name in SCENARIOS
+            if args.mongo or name not in MONGO_SCENARIOS
+        ]
+
+    use_database(args.mongo)
+    results = asyncio.run(run(args))
+
+    args.output.write_text(
+        json.dumps(
+            {
+                'commit': current_commit(),
+                'created': datetime.utcnow().isoformat(),
+                'scale': args.scale,
+                'latency': args.latency,
+                'rate_limit_chance': args.rate_limit_chance,
+                'results': results,
+            },
+            indent=4,
+        )
+    )
+
+    for name, result in results.items():
+        print(
+            f'{name:28} p50 {result["p50_ms"]:10.3f} ms  '
+            f'p99 {result["p99_ms"]:10.3f} ms  '
+            f'{result["throughput"]:10.1f} ops/s'
+        )
+        for key, value in result['measurements'].items():
+            print(f'{"":28} {key} {value:.1f}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+main()
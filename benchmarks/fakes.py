@@ -0,0 +1,363 @@
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime
+from itertools import count
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional
+
+from aiohttp import web
+from discord.errors import Forbidden, NotFound
+
+_snowflakes = count(900_000_000_000_000_000)
+
+
+def snowflake() -> int:
+    return next(_snowflakes)
+
+
+class FakeResponse:
+    def __init__(self, status: int, reason: str = ''):
+        self.status = status
+        self.reason = reason
+
+
+class FakeREST:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.05,
+        jitter: float = 0.01,
+        rate_limit_chance: float = 0.0,
+        retry_after: float = 0.5,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_chance = rate_limit_chance
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.rate_limited = 0
+
+    async def request(self, route: str):
+        self.calls[route] += 1
+
+        # discord.py sleeps for retry_after and retries on a 429
+        while random.random() < self.rate_limit_chance:
+            self.rate_limited += 1
+            await asyncio.sleep(self.retry_after)
+
+        await asyncio.sleep(max(0, random.gauss(self.latency, self.jitter)))
+
+
+class FakeUser:
+    def __init__(self, rest: FakeREST, user_id: int = None):
+        self.rest = rest
+        self.id = user_id or snowflake()
+        self.name = f'user{self.id % 10000}'
+        self.discriminator = '0001'
+        self.avatar_url = ''
+        self.bot = False
+        self.cached = False
+        self.dms_closed = False
+        self.messages = 0
+
+    def __str__(self) -> str:
+        return f'{self.name}#{self.discriminator}'
+
+    def __eq__(self, other) -> bool:
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    @property
+    def mention(self) -> str:
+        return f'<@{self.id}>'
+
+    async def send(self, content: str = None, *, embed=None):
+        await self.rest.request('POST /users/@me/channels')
+        if self.dms_closed:
+            raise Forbidden(FakeResponse(403), 'Cannot send messages')
+
+        await self.rest.request('POST /channels/{channel_id}/messages')
+        self.messages += 1
+
+
+class FakeMember(FakeUser):
+    def __init__(self, rest: FakeREST, guild: 'FakeGuild', user_id: int):
+        super().__init__(rest, user_id)
+        self.guild = guild
+
+
+class FakeGuild:
+    def __init__(
+        self,
+        rest: FakeREST,
+        member_ids: Iterable[int] = (),
+        *,
+        guild_id: int = None,
+        chunked: bool = True,
+        gateway_latency: float = 0.02,
+    ):
+        self.rest = rest
+        self.id = guild_id or snowflake()
+        self.name = f'guild{self.id % 10000}'
+        self.icon_url = ''
+        self.created_at = datetime.utcnow()
+        self.chunked = chunked
+        self.gateway_latency = gateway_latency
+        self.can_ban = True
+        self.banned: List[int] = []
+        self._members: Dict[int, FakeMember] = {
+            member_id: FakeMember(rest, self, member_id)
+            for member_id in member_ids
+        }
+
+    def __str__(self) -> str:
+        return self.name
+
+    @property
+    def member_count(self) -> int:
+        return len(self._members)
+
+    @property
+    def members(self) -> List[FakeMember]:
+        return list(self._members.values())
+
+    def add_member(self, user_id: int) -> FakeMember:
+        member = FakeMember(self.rest, self, user_id)
+        self._members[user_id] = member
+        return member
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        # An unchunked guild only caches members it has seen events for
+        if not self.chunked:
+            return None
+
+        return self._members.get(user_id)
+
+    async def fetch_member(self, user_id: int) -> FakeMember:
+        await self.rest.request('GET /guilds/{guild_id}/members/{user_id}')
+        try:
+            return self._members[user_id]
+        except KeyError:
+            raise NotFound(FakeResponse(404), 'Unknown Member') from None
+
+    async def query_members(
+        self, *, user_ids: List[int], limit: int, cache: bool
+    ) -> List[FakeMember]:
+        await asyncio.sleep(self.gateway_latency)
+        return [
+            self._members[user_id]
+            for user_id in user_ids[:limit]
+            if user_id in self._members
+        ]
+
+    @property
+    def me(self) -> SimpleNamespace:
+        permissions = SimpleNamespace(ban_members=self.can_ban)
+        return SimpleNamespace(guild_permissions=permissions)
+
+    async def fetch_members(self, *, limit: int = None, after=None):
+        # Discord lists members in ID order
+        members = sorted(self._members.values(), key=lambda m: m.id)
+        if after is not None:
+            members = [member for member in members if member.id > after.id]
+
+        for i in range(0, len(members), 1000):
+            await self.rest.request('GET /guilds/{guild_id}/members')
+            for member in members[i : i + 1000]:
+                yield member
+
+    async def ban(self, user, *, reason: str = None):
+        await self.rest.request('PUT /guilds/{guild_id}/bans/{user_id}')
+        if not self.can_ban:
+            raise Forbidden(FakeResponse(403), 'Missing Permissions')
+
+        self.banned.append(user.id)
+        self._members.pop(user.id, None)
+
+    async def bulk_ban(self, user_ids: List[int]) -> Dict[str, List[str]]:
+        await self.rest.request('POST /guilds/{guild_id}/bulk-ban')
+        if not self.can_ban:
+            raise Forbidden(FakeResponse(403), 'Missing Permissions')
+
+        self.banned += user_ids
+        for user_id in user_ids:
+            self._members.pop(user_id, None)
+
+        return {
+            'banned_users': [str(user_id) for user_id in user_ids],
+            'failed_users': [],
+        }
+
+
+class FakeMessage:
+    def __init__(self, channel: 'FakeChannel', message_id: int = None):
+        self.channel = channel
+        self.id = message_id or snowflake()
+
+    async def edit(self, *, embed=None):
+        await self.channel.rest.request(
+            'PATCH /channels/{channel_id}/messages/{message_id}'
+        )
+        self.channel.edited += 1
+
+    async def publish(self):
+        await self.channel.rest.request(
+            'POST /channels/{channel_id}/messages/{message_id}/crosspost'
+        )
+
+
+class FakeChannel:
+    def __init__(self, rest: FakeREST):
+        self.rest = rest
+        self.id = snowflake()
+        self.sent = 0
+        self.embeds = 0
+        self.edited = 0
+
+    async def send(self, content: str = None, *, embed=None, components=None):
+        await self.rest.request('POST /channels/{channel_id}/messages')
+        self.sent += 1
+        self.embeds += embed is not None
+        return FakeMessage(self)
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return FakeMessage(self, message_id)
+
+
+class FakeHTTP:
+    def __init__(self, client: 'FakeClient'):
+        self.client = client
+
+    async def request(self, route, *, json=None, reason: str = None):
+        if route.path == '/channels/{channel_id}/messages':
+            channel = self.client.get_channel(route.channel_id)
+            message = await channel.send(embed=json['embeds'][0])
+            channel.embeds += len(json['embeds']) - 1
+            return {'id': str(message.id)}
+
+        if route.path != '/guilds/{guild_id}/bulk-ban':
+            raise NotImplementedError(route.path)
+
+        guild = self.client.get_guild(route.guild_id)
+        user_ids = [int(user_id) for user_id in json['user_ids']]
+        return await guild.bulk_ban(user_ids)
+
+
+class FakeTopgg:
+    # A local stand-in for the top.gg API that fails its first requests
+    def __init__(self, *, failures: int = 0):
+        self.failures = failures
+        self.posts: List[int] = []
+        self.url = ''
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _post_stats(self, request: web.Request) -> web.Response:
+        if self.failures:
+            self.failures -= 1
+            return web.json_response({'error': 'unavailable'}, status=503)
+
+        self.posts.append((await request.json())['server_count'])
+        return web.json_response({})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bots/stats', self._post_stats)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+class FakeClient:
+    def __init__(self, rest: FakeREST = None):
+        self.rest = rest or FakeREST()
+        self.http = FakeHTTP(self)
+        self.user = FakeUser(self.rest)
+        self.guilds: List[FakeGuild] = []
+        self.channel = FakeChannel(self.rest)
+        self.started = datetime.utcnow()
+        self._guilds: Dict[int, FakeGuild] = {}
+        self._users: Dict[int, FakeUser] = {}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return asyncio.get_event_loop()
+
+    async def wait_until_ready(self):
+        pass
+
+    def add_guild(self, guild: FakeGuild) -> FakeGuild:
+        self.guilds.append(guild)
+        self._guilds[guild.id] = guild
+        return guild
+
+    def add_guilds(self, count: int, **kwargs) -> List[FakeGuild]:
+        return [
+            self.add_guild(FakeGuild(self.rest, **kwargs))
+            for _ in range(count)
+        ]
+
+    def add_user(
+        self, user_id: int = None, *, cached: bool = False
+    ) -> FakeUser:
+        user = FakeUser(self.rest, user_id)
+        user.cached = cached
+        self._users[user.id] = user
+        return user
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self._guilds.get(guild_id)
+
+    def get_user(self, user_id: int) -> Optional[FakeUser]:
+        user = self._users.get(user_id)
+        if user is not None and user.cached:
+            return user
+
+    async def fetch_user(self, user_id: int) -> FakeUser:
+        await self.rest.request('GET /users/{user_id}')
+        try:
+            return self._users[user_id]
+        except KeyError:
+            raise NotFound(FakeResponse(404), 'Unknown User') from None
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        return self.channel
+
+
+class FakeContext:
+    def __init__(
+        self,
+        rest: FakeREST,
+        author: FakeUser,
+        *,
+        custom_id: str = None,
+        selected_options: List[str] = None,
+        interaction_id: str = None,
+        origin_message_id: int = None,
+    ):
+        self.rest = rest
+        self.author = author
+        self.interaction_id = interaction_id or str(snowflake())
+        self.channel_id = snowflake()
+        self.origin_message_id = origin_message_id
+        self.custom_id = custom_id
+        self.selected_options = selected_options
+
+    async def defer(self, *, hidden: bool = False, edit_origin: bool = False):
+        await self.rest.request('POST /interactions/{id}/{token}/callback')
+
+    async def send(self, content: str = None, *, embed=None, hidden=False):
+        await self.rest.request('POST /webhooks/{application_id}/{token}')
+
+    async def edit_origin(self, *, content: str = None, components=None):
+        await self.rest.request('POST /interactions/{id}/{token}/callback')
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import mongoengine
+
+import config
+import database
+import propagation
+from blocklist import BLOCKLIST
+from cluster import CLUSTER
+from config import CLUSTER_ID, CONFIG
+from database import (
+    BanJob,
+    Block,
+    BlockEvent,
+    ClusterStatus,
+    FeedCursor,
+    ModerationBucket,
+    ModerationRollup,
+    ReconcileCursor,
+    Report,
+    ReportCard,
+)
+from logdigest import LOGS
+from modlog import MODLOG
+from reports import REPORTS
+from stats import STATS
+from users import USERS
+
+
+def use_database(host: str = None):
+    mongoengine.disconnect()
+
+    if host is None:
+        import mongomock
+
+        mongoengine.connect(
+            'blockbot-benchmarks', mongo_client_class=mongomock.MongoClient
+        )
+
+        # mongomock isn't thread-safe, so queries have to run one at a time
+        # pylint: disable=protected-access
+        database._executor = ThreadPoolExecutor(max_workers=1)
+    else:
+        mongoengine.connect(host=host)
+
+
+@contextmanager
+def override_config(**sections):
+    # pylint: disable=protected-access
+    snapshot = config._snapshot
+    config._snapshot = snapshot._replace(
+        **{
+            name: getattr(snapshot, name)._replace(**fields)
+            for name, fields in sections.items()
+        }
+    )
+    try:
+        yield
+    finally:
+        config._snapshot = snapshot
+
+
+def reset_state():
+    for document in (
+        Block,
+        Report,
+        ReportCard,
+        BanJob,
+        BlockEvent,
+        ClusterStatus,
+        FeedCursor,
+        ModerationBucket,
+        ModerationRollup,
+        ReconcileCursor,
+    ):
+        document.drop_collection()
+
+    # Production builds these in migrate_reports
+    Report.ensure_indexes()
+
+    BLOCKLIST.__init__()
+    CLUSTER.__init__(
+        CLUSTER_ID, CONFIG.cluster.clusters, CONFIG.cluster.shard_count
+    )
+
+    # Debounced card edits, log flushes and ban DMs would otherwise fire
+    # during the next scenario
+    # pylint: disable=protected-access
+    for task in (
+        *REPORTS._edits.values(),
+        *REPORTS._asks,
+        *LOGS._flushes.values(),
+        *propagation._notifications,
+    ):
+        task.cancel()
+    if MODLOG._flush is not None:
+        MODLOG._flush.cancel()
+    REPORTS.__init__()
+    LOGS.__init__()
+    MODLOG.__init__()
+    STATS.__init__()
+    USERS.__init__(USERS.maxsize, USERS.ttl)
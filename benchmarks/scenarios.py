@@ -0,0 +1,960 @@
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from math import ceil
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from pymongo import monitoring
+from topgg import DBLClient
+
+import main
+from blocklist import BLOCKLIST, BlocklistIndex
+from cluster import CLUSTER, EXTERNAL_CLUSTER_ID, ClusterState
+from config import CONFIG, CONFIG_PATH
+from database import (
+    BanJob,
+    Block,
+    BlockEvent,
+    Report,
+    ReportCard,
+    execute,
+    has_open_report,
+    save,
+    update_feed_watermark,
+    upsert_blocks,
+)
+from exchange import export_blocks, import_blocks
+from guildcount import GuildCountPublisher
+from jobs import BanQueue
+from joins import JoinBatcher
+from logdigest import LOGS
+from metrics import PoolMonitor, render
+from modlog import (
+    MODLOG,
+    block_event,
+    report_event,
+    review_event,
+    summarize,
+)
+from propagation import BanOutcome, find_targets
+from reconcile import DriftReconciler, reconcile_guild
+from stats import STATS
+from users import USERS
+from utils import create_block, create_blocks
+
+from .fakes import (
+    FakeClient,
+    FakeContext,
+    FakeGuild,
+    FakeREST,
+    FakeTopgg,
+    snowflake,
+)
+from .fixtures import override_config
+
+Timings = Tuple[List[float], float]
+
+SCENARIOS: Dict[str, Callable[[FakeREST, int], Awaitable[Timings]]] = {}
+MONGO_SCENARIOS = set()
+
+# Extra figures a scenario reports alongside its timings, keyed by name
+MEASUREMENTS: Dict[str, float] = {}
+
+
+def scenario(name: str, *, requires_mongo: bool = False):
+    def decorator(func):
+        SCENARIOS[name] = func
+        if requires_mongo:
+            MONGO_SCENARIOS.add(name)
+        return func
+
+    return decorator
+
+
+async def timed(awaitable: Awaitable) -> float:
+    start = perf_counter()
+    await awaitable
+    return perf_counter() - start
+
+
+async def run_concurrently(awaitables: Iterable[Awaitable]) -> Timings:
+    start = perf_counter()
+    latencies = await asyncio.gather(*(timed(a) for a in awaitables))
+    return latencies, perf_counter() - start
+
+
+def install(client: FakeClient) -> FakeClient:
+    # Handlers look the client up as a module global at call time
+    main.client = client
+    client.ban_queue = BanQueue(client)
+    client.join_batcher = JoinBatcher(client)
+    return client
+
+
+def current_rss() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return 0
+
+
+async def drain(queue: BanQueue):
+    queue.start()
+    while await queue.depth():
+        await asyncio.sleep(0.05)
+    await queue.stop()
+
+
+async def flush_logs():
+    # pylint: disable=protected-access
+    while LOGS._flushes:
+        await asyncio.gather(*LOGS._flushes.values())
+
+
+async def seed_blocks(user_ids: Iterable[int], moderator_id: int):
+    await upsert_blocks(
+        Block(user_id=user_id, reason='phishing', moderator_id=moderator_id)
+        for user_id in user_ids
+    )
+
+
+async def join_storm(rest: FakeREST, scale: int, *, index: bool) -> Timings:
+    client = install(FakeClient(rest))
+    moderator = client.add_user(cached=True)
+    guild = client.add_guilds(1)[0]
+
+    joiners = [guild.add_member(snowflake()) for _ in range(1000 * scale)]
+    await seed_blocks((member.id for member in joiners[::20]), moderator.id)
+
+    if index:
+        await execute(BLOCKLIST.load)
+
+    return await run_concurrently(
+        main.on_member_join(member) for member in joiners
+    )
+
+
+@scenario('join_storm')
+async def join_storm_with_index(rest: FakeREST, scale: int) -> Timings:
+    return await join_storm(rest, scale, index=True)
+
+
+@scenario('join_storm_without_index')
+async def join_storm_without_index(rest: FakeREST, scale: int) -> Timings:
+    return await join_storm(rest, scale, index=False)
+
+
+async def loop_lag(until: asyncio.Future, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not until.done():
+        start = perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, perf_counter() - start - interval)
+    return worst
+
+
+@scenario('slow_query')
+async def slow_query(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    guild = client.add_guilds(1)[0]
+    await execute(BLOCKLIST.load)
+
+    # Stands in for a slow Atlas round trip holding a database worker
+    duration = 2.0
+    query = asyncio.ensure_future(execute(sleep, duration))
+    lag = asyncio.ensure_future(loop_lag(query))
+
+    async def join_during(delay: float) -> float:
+        await asyncio.sleep(delay)
+        return await timed(main.on_member_join(guild.add_member(snowflake())))
+
+    # Joins arrive spread over the first half of the query
+    joins = 1000 * scale
+    start = perf_counter()
+    latencies = await asyncio.gather(
+        *(join_during(i * duration / 2 / joins) for i in range(joins))
+    )
+    elapsed = perf_counter() - start
+
+    MEASUREMENTS['query_pending'] = not query.done()
+    await query
+    MEASUREMENTS['max_loop_lag_ms'] = await lag * 1000
+
+    return latencies, elapsed
+
+
+@scenario('pool_metrics')
+async def pool_metrics(rest: FakeREST, scale: int) -> Timings:
+    # pymongo calls the listener from its own threads, so the events are
+    # built by hand against an address no real pool uses
+    monitor = PoolMonitor()
+    address = ('pool-metrics', 27017)
+    connections = 100 * scale
+
+    def emit(handler: Callable, event) -> float:
+        start = perf_counter()
+        handler(event)
+        return perf_counter() - start
+
+    start = perf_counter()
+    latencies = [
+        emit(monitor.pool_created, monitoring.PoolCreatedEvent(address, {}))
+    ]
+    for i in range(connections):
+        latencies += [
+            emit(
+                monitor.connection_created,
+                monitoring.ConnectionCreatedEvent(address, i),
+            ),
+            emit(
+                monitor.connection_checked_out,
+                monitoring.ConnectionCheckedOutEvent(address, i, 0.0),
+            ),
+        ]
+    for i in range(connections // 2):
+        latencies += [
+            emit(
+                monitor.connection_checked_in,
+                monitoring.ConnectionCheckedInEvent(address, i),
+            ),
+            emit(
+                monitor.connection_closed,
+                monitoring.ConnectionClosedEvent(address, i, 'idle'),
+            ),
+        ]
+    latencies += [
+        emit(
+            monitor.connection_check_out_failed,
+            monitoring.ConnectionCheckOutFailedEvent(address, 'timeout', 1.0),
+        ),
+        emit(monitor.pool_cleared, monitoring.PoolClearedEvent(address)),
+    ]
+    elapsed = perf_counter() - start
+
+    samples = {}
+    for line in render().splitlines():
+        if 'address="pool-metrics:27017"' in line:
+            name, value = line.rsplit(' ', 1)
+            samples[name.split('{')[0]] = float(value)
+
+    MEASUREMENTS['connections'] = samples['blockbot_mongo_pool_connections']
+    MEASUREMENTS['checked_out'] = samples['blockbot_mongo_pool_checked_out']
+    MEASUREMENTS['checkout_failures'] = samples[
+        'blockbot_mongo_pool_checkout_failures_total'
+    ]
+
+    return latencies, elapsed
+
+
+@scenario('raid')
+async def raid(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderator = client.add_user(cached=True)
+    guilds = client.add_guilds(5)
+
+    # Every raider is blocked, and they arrive over about a second
+    raiders = [
+        guild.add_member(snowflake())
+        for guild in guilds
+        for _ in range(200 * scale)
+    ]
+    await seed_blocks((member.id for member in raiders), moderator.id)
+    await execute(BLOCKLIST.load)
+
+    async def join(member, delay: float):
+        await asyncio.sleep(delay)
+        start = perf_counter()
+        await main.on_member_join(member)
+        return perf_counter() - start
+
+    start = perf_counter()
+    latencies = await asyncio.gather(
+        *(join(member, i / len(raiders)) for i, member in enumerate(raiders))
+    )
+    return list(latencies), perf_counter() - start
+
+
+@scenario('report_flood')
+async def report_flood(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    target = client.add_user(cached=True)
+    reporters = [client.add_user() for _ in range(300 * scale)]
+
+    return await run_concurrently(
+        main.report_command.func(FakeContext(rest, reporter), target, 'scam')
+        for reporter in reporters
+    )
+
+
+@scenario('report_actions')
+async def report_actions(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderator = client.add_user(cached=True)
+
+    # Each card collects several reports that one action resolves together
+    cards = []
+    for _ in range(30 * scale):
+        card = ReportCard(user_id=snowflake(), reports=10)
+        await save(card)
+        cards.append(card)
+
+        for _ in range(card.reports):
+            await save(
+                Report(
+                    reason='scam',
+                    user_id=card.user_id,
+                    reporter_id=snowflake(),
+                    card=card,
+                )
+            )
+
+    return await run_concurrently(
+        main.on_component(
+            FakeContext(
+                rest, moderator, custom_id=f'reportaction_{card.id}_ignore'
+            )
+        )
+        for card in cards
+    )
+
+
+@scenario('lookup_many')
+async def lookup_many(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderators = [client.add_user() for _ in range(5)]
+
+    # Raid triage: half of the looked up users blocked, some reported
+    user_ids = [snowflake() for _ in range(50)]
+    await upsert_blocks(
+        Block(
+            user_id=user_id,
+            reason='phishing',
+            moderator_id=moderators[i % 5].id,
+        )
+        for i, user_id in enumerate(user_ids[::2])
+    )
+    for user_id in user_ids[::5]:
+        await save(
+            Report(reason='raid', user_id=user_id, reporter_id=snowflake())
+        )
+
+    command = ' '.join(map(str, user_ids))
+    return await run_concurrently(
+        main.lookup_many_command.func(FakeContext(rest, moderator), command)
+        for moderator in moderators * 4 * scale
+    )
+
+
+@scenario('report_action_race')
+async def report_action_race(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderators = [client.add_user(cached=True) for _ in range(5)]
+    client.add_guilds(10)
+
+    cards = []
+    users = []
+    for _ in range(10 * scale):
+        users.append(client.add_user())
+        card = ReportCard(user_id=users[-1].id, reports=1)
+        await save(card)
+        await save(
+            Report(
+                reason='scam',
+                user_id=card.user_id,
+                reporter_id=snowflake(),
+                card=card,
+            )
+        )
+        cards.append(card)
+
+    # Every moderator blocks every card at once, and Discord redelivers
+    # each of their interactions
+    contexts = []
+    for card in cards:
+        for moderator in moderators:
+            context = FakeContext(
+                rest,
+                moderator,
+                custom_id=f'reportaction_{card.id}_block',
+                selected_options=['phishing'],
+            )
+            contexts += [context, context]
+
+    timings = await run_concurrently(map(main.on_component, contexts))
+    await flush_logs()
+
+    # pylint: disable=no-member
+    blocks = await execute(lambda: Block.objects.count())
+    dms = [user.messages for user in users]
+    MEASUREMENTS['clicks'] = len(contexts)
+    MEASUREMENTS['blocks'] = blocks
+    MEASUREMENTS['block_dms'] = sum(dms)
+    MEASUREMENTS['block_logs'] = client.channel.sent
+
+    # Each card is acted on once however many clicks it gets
+    if blocks != len(cards) or dms != [1] * len(users):
+        raise RuntimeError(
+            f'{len(cards)} cards made {blocks} blocks and {sum(dms)} DMs'
+        )
+
+    return timings
+
+
+@scenario('guild_join_burst')
+async def guild_join_burst(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    client.guild_count = GuildCountPublisher(None)
+
+    # Getting listed somewhere: a few hundred joins within a few seconds
+    async def join(guild: FakeGuild, delay: float) -> float:
+        await asyncio.sleep(delay)
+        return await timed(main.on_guild_join(guild))
+
+    guilds = [FakeGuild(rest) for _ in range(300 * scale)]
+    start = perf_counter()
+    latencies = await asyncio.gather(
+        *(join(guild, 3 * i / len(guilds)) for i, guild in enumerate(guilds))
+    )
+    await flush_logs()
+    elapsed = perf_counter() - start
+
+    MEASUREMENTS['events'] = len(guilds)
+    MEASUREMENTS['messages'] = client.channel.sent
+    MEASUREMENTS['embeds'] = client.channel.embeds
+
+    return latencies, elapsed
+
+
+@scenario('guild_count_churn')
+async def guild_count_churn(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    guilds = client.add_guilds(1000 * scale)
+    for guild in guilds:
+        STATS.record_guild_join(guild)
+
+    topgg = FakeTopgg(failures=2)
+    await topgg.start()
+    dblclient = DBLClient(client, 'token')
+    dblclient.http.BASE = topgg.url
+    client.guild_count = GuildCountPublisher(dblclient)
+
+    # A mass kick spread over about two seconds, posting every half second.
+    # This mirrors on_guild_remove without its log post, which the channel
+    # rate limit would stretch over minutes.
+    async def leave(guild: FakeGuild, delay: float) -> float:
+        await asyncio.sleep(delay)
+        start = perf_counter()
+        STATS.record_guild_remove(guild)
+        client.guild_count.mark_dirty()
+        return perf_counter() - start
+
+    with override_config(topgg={'post_interval': 0.5, 'retry_delay': 0.1}):
+        client.guild_count.start()
+        client.guild_count.mark_dirty()
+
+        start = perf_counter()
+        latencies = await asyncio.gather(
+            *(
+                leave(guild, 2 * i / len(guilds))
+                for i, guild in enumerate(guilds[: len(guilds) // 2])
+            )
+        )
+        elapsed = perf_counter() - start
+
+        await client.guild_count.stop()
+
+    await dblclient.close()
+    await topgg.stop()
+
+    MEASUREMENTS['events'] = len(latencies)
+    MEASUREMENTS['posts'] = len(topgg.posts)
+    MEASUREMENTS['last_posted'] = topgg.posts[-1]
+    MEASUREMENTS['guilds'] = STATS.guilds
+
+    return latencies, elapsed
+
+
+async def block_propagation(rest: FakeREST, guild_count: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderator = client.add_user(cached=True)
+    target = client.add_user()
+
+    guilds = client.add_guilds(guild_count // 2)
+    guilds += client.add_guilds(guild_count // 2, chunked=False)
+    for guild in guilds[::100]:
+        guild.add_member(target.id)
+
+    async def block():
+        await create_block(
+            client,
+            user_id=target.id,
+            reason='phishing',
+            moderator_id=moderator.id,
+        )
+        await drain(client.ban_queue)
+
+    return await run_concurrently([block()])
+
+
+class CountingBanQueue(BanQueue):
+    runs = Counter()
+
+    async def _run(self, job: BanJob) -> BanOutcome:
+        self.runs[job.guild_id] += 1
+        return await super()._run(job)
+
+
+@scenario('ban_queue_worker_kill')
+async def ban_queue_worker_kill(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderator = client.add_user(cached=True)
+    target = client.add_user()
+    await seed_blocks([target.id], moderator.id)
+
+    guilds = client.add_guilds(100 * scale)
+    for guild in guilds:
+        guild.add_member(target.id)
+    targets = [(guild.id, target.id) for guild in guilds]
+
+    runs = CountingBanQueue.runs
+    runs.clear()
+    held = 0
+
+    async def run():
+        nonlocal held
+
+        # Short leases so the killed worker's jobs come back quickly
+        with override_config(queue={'lease': 1.0, 'poll_interval': 0.1}):
+            doomed = CountingBanQueue(client)
+            survivor = CountingBanQueue(client)
+            await survivor.enqueue(targets)
+            doomed.start()
+            survivor.start()
+
+            # pylint: disable=no-member
+            done = BanJob.objects(status='done').count
+            while await execute(done) < len(targets) // 2:
+                await asyncio.sleep(0.01)
+
+            # The reconciler and block feed re-enqueue guilds the user is
+            # still in, including ones whose jobs are leased
+            await survivor.enqueue(await find_targets(client, [target.id]))
+
+            # Killed mid-run: its leased jobs are never finished
+            # pylint: disable=no-member
+            leased = BanJob.objects(
+                status='leased', worker_id=doomed.worker_id
+            )
+            held = await execute(leased.count)
+            # pylint: disable=protected-access
+            for worker in doomed._workers:
+                worker.cancel()
+
+            await drain(survivor)
+
+    timings = await run_concurrently([run()])
+
+    bans = [len(guild.banned) for guild in guilds]
+    MEASUREMENTS['guilds'] = len(guilds)
+    MEASUREMENTS['missed'] = bans.count(0)
+    MEASUREMENTS['duplicate_bans'] = sum(max(count - 1, 0) for count in bans)
+
+    # Only jobs the killed worker held may run a second time
+    reruns = sum(runs.values()) - len(runs)
+    MEASUREMENTS['killed_holding'] = held
+    MEASUREMENTS['reruns'] = reruns
+
+    missed = MEASUREMENTS['missed']
+    duplicates = MEASUREMENTS['duplicate_bans']
+    if missed or duplicates or reruns > held:
+        raise RuntimeError(
+            f'{missed} guilds missed, {duplicates} duplicate bans, '
+            f'{reruns} reruns for {held} killed jobs'
+        )
+
+    return timings
+
+
+@scenario('propagation_1k')
+async def propagation_1k(rest: FakeREST, scale: int) -> Timings:
+    return await block_propagation(rest, 1000 * scale)
+
+
+@scenario('propagation_10k')
+async def propagation_10k(rest: FakeREST, scale: int) -> Timings:
+    return await block_propagation(rest, 10000 * scale)
+
+
+@scenario('mass_block')
+async def mass_block(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderator = client.add_user(cached=True)
+    targets = [client.add_user() for _ in range(200)]
+
+    guilds = client.add_guilds(1000 * scale)
+    for guild, target in zip(guilds[::5], targets * scale):
+        guild.add_member(target.id)
+
+    async def block():
+        await create_blocks(
+            client,
+            users=targets,
+            reason='phishing',
+            moderator_id=moderator.id,
+        )
+        await drain(client.ban_queue)
+
+    return await run_concurrently([block()])
+
+
+@scenario('cluster_propagation')
+async def cluster_propagation(rest: FakeREST, scale: int) -> Timings:
+    cluster_count, shard_count = 4, 16
+    CLUSTER.__init__(0, cluster_count, shard_count)
+
+    clusters = []
+    for cluster_id in range(cluster_count):
+        state = (
+            CLUSTER
+            if cluster_id == 0
+            else ClusterState(cluster_id, cluster_count, shard_count)
+        )
+        client = FakeClient(rest)
+        client.ban_queue = BanQueue(
+            client, shard_ids=state.shard_ids, shard_count=shard_count
+        )
+        clusters.append((state, client))
+
+    origin = clusters[0][1]
+    main.client = origin
+    moderator = origin.add_user(cached=True)
+    target = origin.add_user()
+
+    # Each guild lives on whichever cluster owns its shard
+    guilds = []
+    for i in range(1000 * scale):
+        guild_id = (1_000_000 + i) << 22
+        shard_id = (guild_id >> 22) % shard_count
+        owner = clusters[shard_id % cluster_count][1]
+        guilds.append(owner.add_guild(FakeGuild(rest, guild_id=guild_id)))
+    for guild in guilds[::100]:
+        guild.add_member(target.id)
+
+    async def block():
+        await create_block(
+            origin,
+            user_id=target.id,
+            reason='phishing',
+            moderator_id=moderator.id,
+        )
+
+        for state, client in clusters[1:]:
+            targets = await find_targets(client, await state.poll())
+            await client.ban_queue.enqueue(targets)
+
+        await asyncio.gather(
+            *(drain(client.ban_queue) for _, client in clusters)
+        )
+
+    timings = await run_concurrently([block()])
+
+    banned = sum(target.id in guild.banned for guild in guilds)
+    if banned != len(guilds[::100]):
+        raise RuntimeError(f'Only {banned} guilds banned the target')
+
+    return timings
+
+
+@scenario('cluster_restart')
+async def cluster_restart(rest: FakeREST, scale: int) -> Timings:
+    # A cluster that went down ten minutes ago, with imports published
+    # while it was away
+    down_at = datetime.utcnow() - timedelta(minutes=10)
+    await update_feed_watermark(1, down_at)
+
+    user_ids = []
+    for i in range(10 * scale):
+        chunk = [snowflake() for _ in range(1000)]
+        await save(
+            BlockEvent(
+                user_ids=chunk,
+                cluster_id=EXTERNAL_CLUSTER_ID,
+                timestamp=down_at + timedelta(seconds=i + 1),
+            )
+        )
+        user_ids += chunk
+
+    state = ClusterState(1, 2, 2)
+    start = perf_counter()
+    polled = await state.poll()
+    elapsed = perf_counter() - start
+
+    MEASUREMENTS['events'] = 10 * scale
+    MEASUREMENTS['users'] = len(polled)
+    if sorted(polled) != sorted(user_ids):
+        raise RuntimeError(
+            f'Resumed feed returned {len(polled)}/{len(user_ids)} users'
+        )
+
+    return [elapsed], elapsed
+
+
+@scenario('guild_join_reconcile')
+async def guild_join_reconcile(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderator = client.add_user(cached=True)
+
+    member_ids = [snowflake() for _ in range(100_000 * scale)]
+    guild = client.add_guilds(1, member_ids=member_ids, chunked=False)[0]
+
+    await seed_blocks(member_ids[::100], moderator.id)
+    await execute(BLOCKLIST.load)
+
+    return await run_concurrently([reconcile_guild(client, guild)])
+
+
+@scenario('drift_reconcile')
+async def drift_reconcile(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderator = client.add_user(cached=True)
+
+    # Guilds of very different sizes, each with a few blocked members left
+    # unbanned
+    missing = []
+    for size in (100, 1000, 10_000, 50_000):
+        for _ in range(scale):
+            member_ids = [snowflake() for _ in range(size)]
+            client.add_guilds(1, member_ids=member_ids, chunked=size < 10_000)
+            missing += member_ids[::1000]
+
+    await seed_blocks(missing, moderator.id)
+    await execute(BLOCKLIST.load)
+
+    # Ticks of a whole drift period, each of which should scan about the
+    # same number of members
+    reconciler = DriftReconciler(client)
+    settings = CONFIG.reconcile
+    ticks = ceil(settings.drift_period / settings.drift_interval)
+    latencies = []
+    found = 0
+    start = perf_counter()
+    for _ in range(ticks):
+        tick_start = perf_counter()
+        found += await reconciler.run()
+        latencies.append(perf_counter() - tick_start)
+
+    MEASUREMENTS['ticks'] = ticks
+    MEASUREMENTS['missing'] = len(missing)
+    MEASUREMENTS['found'] = found
+    MEASUREMENTS['member_pages'] = rest.calls['GET /guilds/{guild_id}/members']
+
+    return latencies, perf_counter() - start
+
+
+async def blocklist_cold_start(scale: int, *, snapshot: bool) -> Timings:
+    moderator_id = snowflake()
+    old = datetime.utcnow() - timedelta(days=1)
+    blocks = [
+        Block(
+            user_id=snowflake(),
+            reason='phishing',
+            moderator_id=moderator_id,
+            timestamp=old,
+        )
+        for _ in range(100_000 * scale)
+    ]
+    # pylint: disable=no-member
+    await execute(Block.objects.insert, blocks, load_bulk=False)
+
+    with TemporaryDirectory() as directory:
+        path = Path(directory) / 'blocklist.snapshot' if snapshot else None
+        if snapshot:
+            await execute(BlocklistIndex(path).load)
+
+            # Blocks created since the snapshot come from the delta query
+            await seed_blocks((snowflake() for _ in range(100)), moderator_id)
+
+        index = BlocklistIndex(path)
+        rss = current_rss()
+        timings = await run_concurrently([execute(index.load)])
+        MEASUREMENTS['rss_mb'] = (current_rss() - rss) / 2**20
+        MEASUREMENTS['blocked'] = len(index)
+
+    return timings
+
+
+@scenario('blocklist_collection_load', requires_mongo=True)
+async def blocklist_collection_load(rest: FakeREST, scale: int) -> Timings:
+    return await blocklist_cold_start(scale, snapshot=False)
+
+
+@scenario('blocklist_snapshot_load', requires_mongo=True)
+async def blocklist_snapshot_load(rest: FakeREST, scale: int) -> Timings:
+    return await blocklist_cold_start(scale, snapshot=True)
+
+
+@scenario('blocklist_import', requires_mongo=True)
+async def blocklist_import(rest: FakeREST, scale: int) -> Timings:
+    reason = next(iter(CONFIG.reason_titles))
+    rows = 1_000_000 * scale
+
+    with TemporaryDirectory() as directory:
+        path = Path(directory) / 'blocks.csv'
+        with path.open('w') as f:
+            f.write('user_id,reason\n')
+            for _ in range(rows):
+                f.write(f'{snowflake()},{reason}\n')
+
+        rss = current_rss()
+        start = perf_counter()
+        with path.open(newline='') as f:
+            result = await import_blocks(f, 'csv', moderator_id=snowflake())
+        import_elapsed = perf_counter() - start
+        MEASUREMENTS['import_rows_per_s'] = rows / import_elapsed
+        MEASUREMENTS['import_rss_mb'] = (current_rss() - rss) / 2**20
+        MEASUREMENTS['inserted'] = result.inserted
+        # pylint: disable=no-member
+        MEASUREMENTS['events'] = await execute(BlockEvent.objects.count)
+
+        start = perf_counter()
+        with (Path(directory) / 'export.jsonl').open('w') as f:
+            await export_blocks(f, 'jsonl')
+        export_elapsed = perf_counter() - start
+        MEASUREMENTS['export_rows_per_s'] = rows / export_elapsed
+
+    return [import_elapsed, export_elapsed], import_elapsed + export_elapsed
+
+
+@scenario('user_cache')
+async def user_cache(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderators = [client.add_user() for _ in range(10)]
+
+    return await run_concurrently(
+        USERS.resolve(client, moderators[i % 10].id)
+        for i in range(1000 * scale)
+    )
+
+
+def time_config_access(config, guild_ids: List[int]) -> Timings:
+    latencies = []
+    start = perf_counter()
+
+    for _ in range(100):
+        batch_start = perf_counter()
+        for guild_id in guild_ids:
+            _ = config.server.channels.reports
+            _ = guild_id in config.noban_servers
+        latencies.append(perf_counter() - batch_start)
+
+    return latencies, perf_counter() - start
+
+
+@scenario('config_dynamic_yaml')
+async def config_dynamic_yaml(rest: FakeREST, scale: int) -> Timings:
+    from dynamic_yaml import load
+
+    with CONFIG_PATH.open() as f:
+        config = load(f)
+
+    return time_config_access(config, list(range(1000 * scale)))
+
+
+@scenario('config_snapshot')
+async def config_snapshot(rest: FakeREST, scale: int) -> Timings:
+    return time_config_access(CONFIG, list(range(1000 * scale)))
+
+
+@scenario('report_queries', requires_mongo=True)
+async def report_queries(rest: FakeREST, scale: int) -> Timings:
+    collection = Report._get_collection()
+
+    user_ids = [snowflake() for _ in range(10_000)]
+    for i in range(0, 1_000_000 * scale, 10_000):
+        await execute(
+            collection.insert_many,
+            [
+                {
+                    'reason': 'scam',
+                    'user_id': user_ids[(i + j) % len(user_ids)],
+                    'reporter_id': i + j,
+                    'timestamp': datetime.utcnow(),
+                    'reviewed': j % 2 == 0,
+                }
+                for j in range(10_000)
+            ],
+        )
+
+    for query in (
+        {'user_id': user_ids[0], 'reporter_id': 1, 'reviewed': False},
+        {'user_id': user_ids[0], 'reviewed': False},
+        {'message_id': 1},
+    ):
+        plan = await execute(lambda: collection.find(query).explain())
+        winning = plan['queryPlanner']['winningPlan']
+        print(f'{query}: {winning.get("inputStage", winning)["stage"]}')
+
+    return await run_concurrently(
+        has_open_report(user_ids[i % len(user_ids)]) for i in range(1000)
+    )
+
+
+@scenario('modstats')
+async def modstats(rest: FakeREST, scale: int) -> Timings:
+    client = install(FakeClient(rest))
+    moderators = [client.add_user() for _ in range(5)]
+    reasons = list(CONFIG.reason_titles)
+
+    # A quarter of moderation history, a day's events at a time
+    now = datetime.utcnow()
+    blocks = 0
+    for day in range(90):
+        timestamp = now - timedelta(days=day)
+        events = []
+        for i in range(50 * scale):
+            user_id = snowflake()
+            moderator_id = moderators[i % len(moderators)].id
+            events.append(
+                block_event(
+                    user_id=user_id,
+                    reason=reasons[i % len(reasons)],
+                    moderator_id=moderator_id,
+                    timestamp=timestamp,
+                )
+            )
+            report = Report(
+                reason='raid',
+                user_id=user_id,
+                reporter_id=snowflake(),
+                timestamp=timestamp,
+            )
+            events.append(report_event(report))
+            events.append(
+                review_event(
+                    ReportCard(user_id=user_id),
+                    moderator_id=moderator_id,
+                    reviewed_at=timestamp,
+                    seconds=60.0,
+                    count=1,
+                )
+            )
+        blocks += 50 * scale
+        MODLOG.record(events)
+        await MODLOG.stop()
+
+    timings = await run_concurrently(
+        main.modstats_command.func(FakeContext(rest, moderator), days=90)
+        for moderator in moderators * 20
+    )
+
+    summary = await summarize(90)
+    MEASUREMENTS['blocks'] = blocks
+    MEASUREMENTS['summarized_blocks'] = sum(summary.blocks.values())
+    MEASUREMENTS['review_minutes'] = summary.average_review_latency / 60
+
+    return timings
@@ -0,0 +1,233 @@
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from heapq import merge
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Set, Tuple
+
+from loguru import logger
+
+from config import CONFIG
+from database import Block
+
+# Blocks saved by other processes can land with a timestamp slightly older
+# than the newest one we've seen, so each delta re-reads a short window.
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+# A snapshot is this header followed by `count` sorted native uint64 IDs
+SNAPSHOT_MAGIC = b'BBSNAP\x00\x01'
+SNAPSHOT_HEADER = struct.Struct('=8sdQ')
+SNAPSHOT_CHUNK = 65536
+
+
+def _to_timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _write_snapshot(path: Path, watermark: datetime, user_ids: Iterable[int]):
+    # Clusters sharing a host may write at the same time
+    temp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    count = 0
+
+    with temp_path.open('wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 0.0, 0))
+
+        user_ids = iter(user_ids)
+        while True:
+            chunk = array('Q', islice(user_ids, SNAPSHOT_CHUNK))
+            if not chunk:
+                break
+
+            chunk.tofile(f)
+            count += len(chunk)
+
+        f.seek(0)
+        f.write(
+            SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, _to_timestamp(watermark), count
+            )
+        )
+
+    os.replace(temp_path, path)
+
+
+def _map_snapshot(path: Path) -> Optional[Tuple[memoryview, datetime]]:
+    try:
+        with path.open('rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if len(mapped) >= SNAPSHOT_HEADER.size:
+        magic, timestamp, count = SNAPSHOT_HEADER.unpack_from(mapped)
+        size = SNAPSHOT_HEADER.size + count * 8
+        if magic == SNAPSHOT_MAGIC and len(mapped) == size:
+            user_ids = memoryview(mapped)[SNAPSHOT_HEADER.size :].cast('Q')
+            return user_ids, datetime.utcfromtimestamp(timestamp)
+
+    logger.warning(f'Ignoring invalid blocklist snapshot at {path}')
+    return None
+
+
+class BlocklistIndex:
+    def __init__(self, snapshot_path: Optional[Path] = None):
+        self.snapshot_path = snapshot_path
+        self.watermark: Optional[datetime] = None
+
+        # Sorted IDs from the last load or snapshot, plus what changed since
+        self._user_ids: Sequence[int] = array('Q')
+        self._added: Set[int] = set()
+        self._removed: Set[int] = set()
+
+    def __contains__(self, user_id: int) -> bool:
+        if user_id in self._added:
+            return True
+        if user_id in self._removed:
+            return False
+
+        return self._in_sorted(user_id)
+
+    def __len__(self) -> int:
+        return len(self._user_ids) - len(self._removed) + len(self._added)
+
+    @property
+    def loaded(self) -> bool:
+        return self.watermark is not None
+
+    def _in_sorted(self, user_id: int) -> bool:
+        user_ids = self._user_ids
+        i = bisect_left(user_ids, user_id)
+        return i < len(user_ids) and user_ids[i] == user_id
+
+    def add(self, user_id: int):
+        self._removed.discard(user_id)
+        if not self._in_sorted(user_id):
+            self._added.add(user_id)
+
+    def discard(self, user_id: int):
+        self._added.discard(user_id)
+        if self._in_sorted(user_id):
+            self._removed.add(user_id)
+
+    def load(self):
+        snapshot = None
+        if self.snapshot_path is not None:
+            snapshot = _map_snapshot(self.snapshot_path)
+
+        if snapshot is None:
+            self._load_collection()
+            return
+
+        self._user_ids, self.watermark = snapshot
+        self._added = set()
+        self._removed = set()
+        logger.info(
+            f'Mapped {len(self._user_ids)} blocked users from the snapshot'
+        )
+
+        self.refresh()
+
+    def _load_collection(self):
+        user_ids = array('Q')
+
+        # Blocks saved while the scan runs may not be in it, so the next
+        # refresh reads back from when it started
+        watermark = datetime.utcnow()
+        removed_before = set(self._removed)
+
+        # Ordering by the primary key reads the IDs already sorted
+        # pylint: disable=no-member
+        for user_id in Block.objects.order_by('user_id').scalar('user_id'):
+            user_ids.append(user_id)
+
+        # Adds and discards made during the scan still apply on top of it
+        added = set(self._added)
+        removed = set(self._removed) - removed_before
+        self._user_ids = user_ids
+        self._added = {
+            user_id for user_id in added if not self._in_sorted(user_id)
+        }
+        self._removed = {
+            user_id for user_id in removed if self._in_sorted(user_id)
+        }
+        self.watermark = watermark
+
+        logger.info(f'Loaded {len(user_ids)} blocked users into the index')
+
+        if self.snapshot_path is not None:
+            _write_snapshot(self.snapshot_path, watermark, user_ids)
+            self._user_ids, _ = _map_snapshot(self.snapshot_path)
+
+    def refresh(self) -> int:
+        if not self.loaded:
+            self.load()
+            return len(self)
+
+        added = 0
+        watermark = self.watermark
+
+        # pylint: disable=no-member
+        for user_id, timestamp in Block.objects(
+            timestamp__gte=self.watermark - REFRESH_OVERLAP
+        ).scalar('user_id', 'timestamp'):
+            if user_id not in self:
+                self.add(user_id)
+                added += 1
+            watermark = max(watermark, timestamp)
+
+        self.watermark = watermark
+
+        if added:
+            logger.debug(f'Added {added} blocked users to the index')
+
+        return added
+
+    def save_snapshot(self) -> bool:
+        if self.snapshot_path is None or not self.loaded:
+            return False
+
+        # Runs off the event loop, so work from copies and only drop the
+        # changes that made it into the new snapshot
+        watermark = self.watermark
+        added = set(self._added)
+        removed = set(self._removed)
+        if not added and not removed:
+            return False
+
+        current = self._user_ids
+        _write_snapshot(
+            self.snapshot_path,
+            watermark,
+            merge(
+                (user_id for user_id in current if user_id not in removed),
+                sorted(added),
+            ),
+        )
+
+        self._user_ids, _ = _map_snapshot(self.snapshot_path)
+
+        # Adds and discards that happened during the write still apply
+        for user_id in added:
+            if user_id in self._added:
+                self._added.discard(user_id)
+            else:
+                self._removed.add(user_id)
+        for user_id in removed:
+            if user_id in self._removed:
+                self._removed.discard(user_id)
+            else:
+                self._added.add(user_id)
+
+        logger.info(
+            f'Saved {len(self._user_ids)} blocked users to the snapshot'
+        )
+        return True
+
+
+BLOCKLIST = BlocklistIndex(
+    Path(__file__).parent / CONFIG.blocklist.snapshot_path
+)
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+from config import CLUSTER_ID, CONFIG
+from database import (
+    find_block_events,
+    find_cluster_statuses,
+    find_feed_watermark,
+    publish_block_event,
+    update_cluster_status,
+    update_feed_watermark,
+)
+from stats import STATS
+
+# Events from other clusters can land with a timestamp slightly older than
+# the newest one we've seen, so each poll re-reads a short window
+FEED_OVERLAP = timedelta(seconds=30)
+
+# Published by processes outside the bot, like the blocklist importer
+EXTERNAL_CLUSTER_ID = -1
+
+
+class ClusterState:
+    def __init__(self, cluster_id: int, clusters: int, shard_count: int):
+        self.cluster_id = cluster_id
+        self.clusters = clusters
+        self.shard_count = shard_count
+        self.watermark: Optional[datetime] = None
+        self._seen: Dict[ObjectId, datetime] = {}
+        self._remote_guilds = 0
+        self._remote_members = 0
+
+    @property
+    def clustered(self) -> bool:
+        return self.clusters > 1
+
+    @property
+    def primary(self) -> bool:
+        return self.cluster_id == 0
+
+    @property
+    def shard_ids(self) -> List[int]:
+        return list(range(self.cluster_id, self.shard_count, self.clusters))
+
+    @property
+    def guilds(self) -> int:
+        return STATS.guilds + self._remote_guilds
+
+    @property
+    def members(self) -> int:
+        return STATS.members + self._remote_members
+
+    async def publish(self, user_ids: List[int]):
+        if self.clustered:
+            await publish_block_event(self.cluster_id, user_ids)
+
+    async def poll(self) -> List[int]:
+        if self.watermark is None:
+            # Resumed from where the last process left off, so blocks
+            # published while this cluster was down are still banned
+            self.watermark = await find_feed_watermark(self.cluster_id)
+            if self.watermark is None:
+                self.watermark = datetime.utcnow()
+                await self.save_watermark()
+
+        events = await find_block_events(
+            self.watermark - FEED_OVERLAP, self.cluster_id
+        )
+
+        user_ids = []
+        for event in events:
+            if event.id in self._seen:
+                continue
+
+            self._seen[event.id] = event.timestamp
+            self.watermark = max(self.watermark, event.timestamp)
+            user_ids += event.user_ids
+
+        cutoff = self.watermark - FEED_OVERLAP
+        self._seen = {
+            event_id: timestamp
+            for event_id, timestamp in self._seen.items()
+            if timestamp >= cutoff
+        }
+
+        return user_ids
+
+    async def save_watermark(self):
+        await update_feed_watermark(self.cluster_id, self.watermark)
+
+    async def sync_status(self):
+        await update_cluster_status(
+            self.cluster_id, STATS.guilds, STATS.members
+        )
+
+        # Clusters that stopped reporting drop out of the totals
+        since = datetime.utcnow() - timedelta(
+            seconds=3 * CONFIG.cluster.status_interval
+        )
+        remote = [
+            status
+            for status in await find_cluster_statuses(since)
+            if status.cluster_id != self.cluster_id
+        ]
+
+        self._remote_guilds = sum(status.guilds for status in remote)
+        self._remote_members = sum(status.members for status in remote)
+
+
+CLUSTER = ClusterState(
+    CLUSTER_ID, CONFIG.cluster.clusters, CONFIG.cluster.shard_count
+)
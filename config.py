@@ -1,6 +1,272 @@
+import os
+from functools import reduce
 from pathlib import Path
+from types import MappingProxyType
+from typing import (
+    Any,
+    FrozenSet,
+    Mapping,
+    NamedTuple,
+    Tuple,
+    get_origin,
+    get_type_hints,
+)
 
 from dynamic_yaml import load
+from loguru import logger
 
-with (Path(__file__).parent / 'config.yaml').open() as f:
-    CONFIG = load(f)
+CONFIG_PATH = Path(__file__).parent / 'config.yaml'
+
+# Set per process by the launcher, the rest of the config is shared
+CLUSTER_ENV = 'BLOCKBOT_CLUSTER'
+CLUSTER_ID = int(os.environ.get(CLUSTER_ENV, '0'))
+
+# Read once at import or startup: the database client and executor, the
+# outbound scheduler, the user cache, task loop intervals, the ban queue
+# workers, the metrics server, clustering, and slash command registrations
+# and permissions. Changing these takes a restart.
+RESTART_REQUIRED = (
+    'bot',
+    'database.host',
+    'database.workers',
+    'database.min_pool_size',
+    'database.max_pool_size',
+    'database.connect_timeout',
+    'database.server_selection_timeout',
+    'blocklist.refresh_interval',
+    'blocklist.snapshot_path',
+    'blocklist.snapshot_interval',
+    'scheduler',
+    'queue.workers',
+    'queue.lease',
+    'reconcile.concurrency',
+    'reconcile.drift_interval',
+    'stats',
+    'users',
+    'cluster',
+    'metrics',
+    'topgg.token',
+    'sentry',
+    'server.id',
+    'server.roles',
+    'reasons',
+)
+
+
+class BotConfig(NamedTuple):
+    token: str
+
+
+class DatabaseConfig(NamedTuple):
+    host: str
+    workers: int
+    min_pool_size: int
+    max_pool_size: int
+    connect_timeout: float
+    server_selection_timeout: float
+    read_preference: str
+    max_staleness: int
+
+
+class BlocklistConfig(NamedTuple):
+    refresh_interval: float
+    snapshot_path: str
+    snapshot_interval: float
+
+
+class PropagationConfig(NamedTuple):
+    concurrency: int
+
+
+class SchedulerConfig(NamedTuple):
+    rate: float
+    bucket_rate: float
+    bucket_per: float
+    log_backlog: int
+    dm_backlog: int
+
+
+class QueueConfig(NamedTuple):
+    workers: int
+    lease: float
+    poll_interval: float
+    max_attempts: int
+    backoff: float
+
+
+class ReconcileConfig(NamedTuple):
+    concurrency: int
+    chunk_size: int
+    drift_period: float
+    drift_interval: float
+
+
+class StatsConfig(NamedTuple):
+    reconcile_interval: float
+
+
+class UsersConfig(NamedTuple):
+    cache_size: int
+    cache_ttl: float
+
+
+class JoinsConfig(NamedTuple):
+    batch_delay: float
+    raid_size: int
+
+
+class ReportsConfig(NamedTuple):
+    window: float
+    edit_delay: float
+    samples: int
+
+
+class LogsConfig(NamedTuple):
+    flush_interval: float
+    table_threshold: int
+
+
+class ClusterConfig(NamedTuple):
+    clusters: int
+    shard_count: int
+    feed_interval: float
+    status_interval: float
+
+
+class MetricsConfig(NamedTuple):
+    host: str
+    port: int
+
+
+class TopggConfig(NamedTuple):
+    token: str
+    post_interval: float
+    retry_delay: float
+
+
+class SentryConfig(NamedTuple):
+    dsn: str
+
+
+class ChannelsConfig(NamedTuple):
+    block_logs: int
+    reports: int
+    server_joins: int
+    server_leaves: int
+
+
+class RolesConfig(NamedTuple):
+    developer: int
+    global_mod: int
+    everyone: int
+
+
+class ServerConfig(NamedTuple):
+    id: int
+    appeals_id: int
+    invite: str
+    appeals_invite: str
+    channels: ChannelsConfig
+    roles: RolesConfig
+
+
+class Config(NamedTuple):
+    bot: BotConfig
+    database: DatabaseConfig
+    blocklist: BlocklistConfig
+    propagation: PropagationConfig
+    scheduler: SchedulerConfig
+    queue: QueueConfig
+    reconcile: ReconcileConfig
+    stats: StatsConfig
+    users: UsersConfig
+    joins: JoinsConfig
+    reports: ReportsConfig
+    logs: LogsConfig
+    cluster: ClusterConfig
+    metrics: MetricsConfig
+    topgg: TopggConfig
+    sentry: SentryConfig
+    server: ServerConfig
+    immune: FrozenSet[int]
+    noban_servers: FrozenSet[int]
+    reasons: Tuple[Tuple[str, str], ...]
+    reason_titles: Mapping[str, str]
+
+
+def _convert(kind: Any, value: Any) -> Any:
+    if isinstance(kind, type) and issubclass(kind, tuple):
+        hints = get_type_hints(kind)
+        return kind(
+            *(_convert(hints[field], value[field]) for field in kind._fields)
+        )
+    elif get_origin(kind) is frozenset:
+        return frozenset(int(item) for item in value)
+
+    return kind(value)
+
+
+def load_config(path: Path = CONFIG_PATH) -> Config:
+    with path.open() as f:
+        raw = load(f)
+
+    reasons = tuple((str(value), str(title)) for value, title in raw.reasons)
+    hints = get_type_hints(Config)
+
+    return Config(
+        **{
+            field: _convert(hints[field], raw[field])
+            for field in Config._fields
+            if field not in ('reasons', 'reason_titles')
+        },
+        reasons=reasons,
+        reason_titles=MappingProxyType(dict(reasons)),
+    )
+
+
+class _ConfigProxy:
+    __slots__ = ()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(_snapshot, name)
+
+
+_snapshot = load_config()
+_mtime = CONFIG_PATH.stat().st_mtime
+
+# Always reads the current snapshot, so modules can keep importing CONFIG
+CONFIG = _ConfigProxy()
+
+
+def reload_config() -> bool:
+    global _snapshot, _mtime
+
+    mtime = CONFIG_PATH.stat().st_mtime
+    if mtime == _mtime:
+        return False
+
+    try:
+        snapshot = load_config()
+    except Exception:
+        logger.exception('Failed to reload config, keeping the old one')
+        return False
+    finally:
+        _mtime = mtime
+
+    changed = [
+        name
+        for name in RESTART_REQUIRED
+        if _lookup(snapshot, name) != _lookup(_snapshot, name)
+    ]
+    if changed:
+        logger.warning(
+            f'Changes to {", ".join(changed)} take effect after a restart'
+        )
+
+    _snapshot = snapshot
+    logger.info('Reloaded config')
+    return True
+
+
+def _lookup(config: Config, name: str) -> Any:
+    return reduce(getattr, name.split('.'), config)
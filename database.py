@@ -1,10 +1,69 @@
-from datetime import datetime
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
 import mongoengine
+from bson import ObjectId
+from loguru import logger
+from mongoengine.queryset.visitor import Q
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import OperationFailure
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+    _ServerMode,
+)
 
 from config import CONFIG
+from metrics import CommandTimer, PoolMonitor
 
-mongoengine.connect(host=CONFIG.database.host)
+T = TypeVar('T')
+
+BUCKET_SIZE = 500
+
+READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+# Only registered here: the client is created, and the host resolved, on
+# the first query rather than at import time
+mongoengine.register_connection(
+    mongoengine.DEFAULT_CONNECTION_NAME,
+    host=CONFIG.database.host,
+    minPoolSize=CONFIG.database.min_pool_size,
+    maxPoolSize=CONFIG.database.max_pool_size,
+    connectTimeoutMS=int(CONFIG.database.connect_timeout * 1000),
+    serverSelectionTimeoutMS=int(
+        CONFIG.database.server_selection_timeout * 1000
+    ),
+    event_listeners=[CommandTimer(), PoolMonitor()],
+)
+
+# mongoengine is synchronous, so every query runs on this pool instead of
+# the event loop. Its size bounds how many queries can be in flight.
+_executor = ThreadPoolExecutor(
+    max_workers=CONFIG.database.workers, thread_name_prefix='database'
+)
 
 
 class Block(mongoengine.Document):
@@ -15,6 +74,23 @@ class Block(mongoengine.Document):
         required=True, default=datetime.utcnow
     )
 
+    # Serves the blocklist index's delta reads
+    meta = {'indexes': ['timestamp']}
+
+
+class ReportCard(mongoengine.Document):
+    user_id = mongoengine.IntField(required=True)
+    opened_at = mongoengine.DateTimeField(
+        required=True, default=datetime.utcnow
+    )
+    channel_id = mongoengine.IntField()
+    message_id = mongoengine.IntField()
+    reports = mongoengine.IntField(required=True, default=0)
+    closed = mongoengine.BooleanField(required=True, default=False)
+    asked = mongoengine.BooleanField(required=True, default=False)
+
+    meta = {'indexes': [('user_id', 'closed', 'opened_at')]}
+
 
 class Report(mongoengine.Document):
     reason = mongoengine.StringField(required=True)
@@ -25,3 +101,670 @@ class Report(mongoengine.Document):
     )
     message_id = mongoengine.IntField()
     reviewed = mongoengine.BooleanField(required=True, default=False)
+    reviewed_at = mongoengine.DateTimeField()
+    card = mongoengine.ReferenceField(ReportCard)
+
+    meta = {
+        'indexes': [
+            # Also serves lookups by user_id and reviewed alone
+            ('user_id', 'reviewed', 'reporter_id'),
+            ('card', 'reviewed'),
+            {'fields': ['message_id'], 'unique': True, 'sparse': True},
+        ],
+        # Built by migrate_reports, since existing duplicates would make the
+        # unique index fail to build on first access
+        'auto_create_index': False,
+    }
+
+
+class BanJob(mongoengine.Document):
+    user_id = mongoengine.IntField(required=True)
+    guild_id = mongoengine.IntField(required=True)
+    shard_id = mongoengine.IntField(required=True, default=0)
+    status = mongoengine.StringField(
+        required=True,
+        default='pending',
+        choices=('pending', 'leased', 'done', 'failed'),
+    )
+    attempts = mongoengine.IntField(required=True, default=0)
+    available_at = mongoengine.DateTimeField(
+        required=True, default=datetime.utcnow
+    )
+    lease_expires = mongoengine.DateTimeField()
+    worker_id = mongoengine.StringField()
+    outcome = mongoengine.StringField()
+    completed = mongoengine.DateTimeField()
+
+    meta = {
+        'indexes': [
+            {'fields': ['user_id', 'guild_id'], 'unique': True},
+            ('status', 'available_at'),
+            ('status', 'lease_expires'),
+        ]
+    }
+
+
+class BlockEvent(mongoengine.Document):
+    user_ids = mongoengine.ListField(mongoengine.IntField(), required=True)
+    cluster_id = mongoengine.IntField(required=True)
+    timestamp = mongoengine.DateTimeField(
+        required=True, default=datetime.utcnow
+    )
+
+    meta = {
+        'indexes': [
+            # Clusters only read recent events, so old ones can expire
+            {'fields': ['timestamp'], 'expireAfterSeconds': 24 * 60 * 60}
+        ]
+    }
+
+
+class ReconcileCursor(mongoengine.Document):
+    guild_id = mongoengine.IntField(primary_key=True)
+    # Last member scanned in an unfinished pass, or 0 between passes
+    member_after = mongoengine.IntField(required=True, default=0)
+    reconciled_at = mongoengine.DateTimeField()
+
+
+class FeedCursor(mongoengine.Document):
+    cluster_id = mongoengine.IntField(primary_key=True)
+    # Newest block event the cluster has handled
+    watermark = mongoengine.DateTimeField(required=True)
+
+
+class ModerationBucket(mongoengine.Document):
+    # Append-only: events are pushed onto the day's newest bucket until it
+    # holds BUCKET_SIZE of them, then a new bucket is started
+    day = mongoengine.DateTimeField(required=True)
+    size = mongoengine.IntField(required=True, default=0)
+    events = mongoengine.ListField(mongoengine.DictField())
+
+    meta = {'indexes': [('day', 'size')]}
+
+
+class ModerationRollup(mongoengine.Document):
+    day = mongoengine.DateTimeField(primary_key=True)
+    # Block counts by reason
+    blocks = mongoengine.DictField()
+    # Block and review counts by moderator ID
+    moderators = mongoengine.DictField()
+    reports = mongoengine.IntField(required=True, default=0)
+    reviewed = mongoengine.IntField(required=True, default=0)
+    review_seconds = mongoengine.FloatField(required=True, default=0.0)
+
+
+class ClusterStatus(mongoengine.Document):
+    cluster_id = mongoengine.IntField(primary_key=True)
+    guilds = mongoengine.IntField(required=True)
+    members = mongoengine.IntField(required=True)
+    updated_at = mongoengine.DateTimeField(required=True)
+
+
+def _read_preference() -> _ServerMode:
+    mode = READ_PREFERENCES[CONFIG.database.read_preference]
+    if mode is Primary:
+        return mode()
+
+    return mode(max_staleness=CONFIG.database.max_staleness)
+
+
+def _stale_reads(document) -> mongoengine.QuerySet:
+    # For reads that can lag the primary by up to max_staleness, such as
+    # stats and lookups. Anything that decides a write stays on the primary.
+    return document.objects.read_preference(_read_preference())
+
+
+def _aggregate(document, pipeline: List[Dict]) -> List[Dict]:
+    return list(_stale_reads(document).aggregate(pipeline))
+
+
+# Querysets and collections have to be built inside the callable too. The
+# first access per document class connects, waits on server selection and
+# ensures indexes.
+async def execute(func: Callable[..., T], *args, **kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, partial(func, *args, **kwargs)
+    )
+
+
+async def save(document: mongoengine.Document):
+    await execute(document.save)
+
+
+async def get_block(user_id: int) -> Block:
+    # pylint: disable=no-member
+    return await execute(lambda: Block.objects.get(user_id=user_id))
+
+
+async def upsert_blocks(blocks: Iterable[Block]):
+    operations = [
+        ReplaceOne({'_id': block.user_id}, block.to_mongo(), upsert=True)
+        for block in blocks
+    ]
+
+    # pylint: disable=protected-access
+    await execute(
+        lambda: Block._get_collection().bulk_write(operations, ordered=False)
+    )
+
+
+async def insert_blocks(blocks: Dict[int, Dict]) -> List[int]:
+    # Users who are already blocked keep their original block
+    operations = [
+        UpdateOne({'_id': user_id}, {'$setOnInsert': fields}, upsert=True)
+        for user_id, fields in blocks.items()
+    ]
+    if not operations:
+        return []
+
+    # pylint: disable=protected-access
+    result = await execute(
+        lambda: Block._get_collection().bulk_write(operations, ordered=False)
+    )
+    return list(result.upserted_ids.values())
+
+
+async def stream_blocks(
+    batch_size: int, **filters
+) -> AsyncIterator[List[Dict]]:
+    # Raw documents with only the exported fields, a batch at a time
+    # pylint: disable=protected-access
+    cursor = await execute(
+        lambda: Block._get_collection().find(
+            filters,
+            {'reason': True, 'moderator_id': True, 'timestamp': True},
+            batch_size=batch_size,
+        )
+    )
+    try:
+        while True:
+            batch = await execute(list, islice(cursor, batch_size))
+            if not batch:
+                break
+            yield batch
+    finally:
+        cursor.close()
+
+
+async def find_block(user_id: int) -> Optional[Block]:
+    # pylint: disable=no-member
+    return await execute(lambda: Block.objects(user_id=user_id).first())
+
+
+async def find_blocks(
+    user_ids: List[int], *, stale: bool = False
+) -> Dict[int, Block]:
+    def find() -> List[Block]:
+        # pylint: disable=no-member
+        documents = _stale_reads(Block) if stale else Block.objects
+        return list(documents(user_id__in=user_ids))
+
+    return {block.user_id: block for block in await execute(find)}
+
+
+async def find_blocked(user_ids: List[int]) -> Set[int]:
+    # pylint: disable=no-member
+    return set(
+        await execute(
+            lambda: list(Block.objects(user_id__in=user_ids).scalar('user_id'))
+        )
+    )
+
+
+async def count_blocks() -> int:
+    return await execute(lambda: _stale_reads(Block).count())
+
+
+async def count_blocks_by_reason() -> Dict[str, int]:
+    pipeline = [{'$group': {'_id': '$reason', 'count': {'$sum': 1}}}]
+    results = await execute(_aggregate, Block, pipeline)
+    return {result['_id']: result['count'] for result in results}
+
+
+async def get_report(report_id: str) -> Report:
+    # pylint: disable=no-member
+    return await execute(lambda: Report.objects.get(id=report_id))
+
+
+async def count_reports() -> int:
+    return await execute(lambda: _stale_reads(Report).count())
+
+
+async def sum_review_latency() -> Tuple[float, int]:
+    latency = {'$subtract': ['$reviewed_at', '$timestamp']}
+    pipeline = [
+        {'$match': {'reviewed_at': {'$exists': True}}},
+        {
+            '$group': {
+                '_id': None,
+                'total': {'$sum': latency},
+                'count': {'$sum': 1},
+            }
+        },
+    ]
+    results = await execute(_aggregate, Report, pipeline)
+    if not results:
+        return 0.0, 0
+
+    # Date subtraction yields milliseconds
+    return results[0]['total'] / 1000, results[0]['count']
+
+
+async def get_card(card_id: str) -> ReportCard:
+    # pylint: disable=no-member
+    return await execute(lambda: ReportCard.objects.get(id=card_id))
+
+
+async def find_open_card(
+    user_id: int, since: datetime
+) -> Optional[ReportCard]:
+    def find() -> Optional[ReportCard]:
+        # pylint: disable=no-member
+        query = ReportCard.objects(
+            user_id=user_id, closed=False, opened_at__gte=since
+        )
+        return query.order_by('-opened_at').first()
+
+    return await execute(find)
+
+
+async def adopt_reports(card: ReportCard) -> int:
+    # pylint: disable=no-member
+    return await execute(
+        lambda: Report.objects(
+            user_id=card.user_id, reviewed=False, card=None
+        ).update(set__card=card.id)
+    )
+
+
+async def discard_card(card: ReportCard):
+    # pylint: disable=no-member
+    await execute(lambda: Report.objects(card=card).update(unset__card=True))
+    await execute(card.delete)
+
+
+async def attach_report(card: ReportCard, report: Report) -> bool:
+    # A card being opened may have adopted the report already
+    # pylint: disable=no-member
+    attached = await execute(
+        lambda: Report.objects(id=report.id, card=None).update_one(
+            set__card=card.id
+        )
+    )
+    if attached:
+        counted = await execute(
+            lambda: ReportCard.objects(id=card.id, closed=False).update_one(
+                inc__reports=1
+            )
+        )
+
+        # Closing a card reviews the reports on it, so one attached after
+        # that would never be seen. Unless it was reviewed anyway, it's
+        # taken back for another card.
+        if not counted:
+            detached = await execute(
+                lambda: Report.objects(
+                    id=report.id, reviewed=False
+                ).update_one(unset__card=True)
+            )
+            if detached:
+                return False
+
+    report.card = card
+    return True
+
+
+async def claim_card(card_id: str, flag: str) -> Optional[ReportCard]:
+    # Only the first caller to set the flag on an open card gets it back
+    filters = {'closed': False, flag: False}
+
+    # pylint: disable=no-member
+    return await execute(
+        lambda: ReportCard.objects(id=card_id, **filters).modify(
+            new=True, **{f'set__{flag}': True}
+        )
+    )
+
+
+async def release_card(card_id: str, flag: str):
+    # pylint: disable=no-member
+    await execute(
+        lambda: ReportCard.objects(id=card_id, **{flag: True}).update_one(
+            **{f'set__{flag}': False}
+        )
+    )
+
+
+def _adopt_legacy_report(
+    report_id: str, channel_id: int, message_id: int
+) -> Optional[ObjectId]:
+    # pylint: disable=no-member
+    report = (
+        Report.objects(id=report_id)
+        .only('user_id', 'timestamp', 'reviewed', 'card')
+        .as_pymongo()
+        .first()
+    )
+    if report is None or report['reviewed']:
+        return None
+    if report.get('card') is not None:
+        return report['card']
+
+    # The card takes the report's ID, so the buttons on the old message
+    # match it
+    card_id = report['_id']
+    ReportCard.objects(id=card_id).update_one(
+        upsert=True,
+        set_on_insert__user_id=report['user_id'],
+        set_on_insert__opened_at=report['timestamp'],
+        set_on_insert__channel_id=channel_id,
+        set_on_insert__message_id=message_id,
+        set_on_insert__closed=False,
+        set_on_insert__asked=False,
+    )
+    adopted = Report.objects(
+        user_id=report['user_id'], reviewed=False, card=None
+    ).update(set__card=card_id)
+    if adopted:
+        ReportCard.objects(id=card_id).update_one(inc__reports=adopted)
+
+    return card_id
+
+
+async def adopt_legacy_report(
+    report_id: str, channel_id: int, message_id: int
+) -> Optional[ObjectId]:
+    return await execute(
+        _adopt_legacy_report, report_id, channel_id, message_id
+    )
+
+
+async def find_card_reports(card: ReportCard, limit: int) -> List[Report]:
+    # pylint: disable=no-member
+    return await execute(
+        lambda: list(
+            Report.objects(card=card).order_by('-timestamp').limit(limit)
+        )
+    )
+
+
+async def find_card_reporters(card: ReportCard) -> List[int]:
+    # pylint: disable=no-member
+    return await execute(
+        lambda: list(
+            Report.objects(card=card, reviewed=False).scalar('reporter_id')
+        )
+    )
+
+
+def _resolve_reports(
+    card: ReportCard, reviewed_at: datetime
+) -> Tuple[float, int]:
+    # pylint: disable=no-member
+    reports = Report.objects(
+        card=card, reviewed=False, timestamp__lte=reviewed_at
+    )
+    timestamps = list(reports.scalar('timestamp'))
+    reports.update(reviewed=True, reviewed_at=reviewed_at)
+
+    latency = sum(
+        (reviewed_at - timestamp).total_seconds() for timestamp in timestamps
+    )
+    return latency, len(timestamps)
+
+
+async def resolve_reports(
+    card: ReportCard, reviewed_at: datetime
+) -> Tuple[float, int]:
+    return await execute(_resolve_reports, card, reviewed_at)
+
+
+async def count_open_reports(user_ids: List[int]) -> Dict[int, int]:
+    pipeline = [
+        {'$match': {'user_id': {'$in': user_ids}, 'reviewed': False}},
+        {'$group': {'_id': '$user_id', 'count': {'$sum': 1}}},
+    ]
+    results = await execute(_aggregate, Report, pipeline)
+    return {result['_id']: result['count'] for result in results}
+
+
+async def has_open_report(user_id: int, **filters) -> bool:
+    # pylint: disable=no-member
+    report = await execute(
+        lambda: Report.objects(user_id=user_id, reviewed=False, **filters)
+        .only('id')
+        .first()
+    )
+    return report is not None
+
+
+def _migrate_reports():
+    # Reports saved before message_id was unique may share a message. The
+    # oldest keeps the link and the rest become plain reports.
+    pipeline = [
+        {'$match': {'message_id': {'$ne': None}}},
+        {
+            '$group': {
+                '_id': '$message_id',
+                'ids': {'$push': '$_id'},
+                'count': {'$sum': 1},
+            }
+        },
+        {'$match': {'count': {'$gt': 1}}},
+    ]
+    # pylint: disable=protected-access
+    collection = Report._get_collection()
+    duplicates = [
+        report_id
+        for group in collection.aggregate(pipeline, allowDiskUse=True)
+        for report_id in sorted(group['ids'])[1:]
+    ]
+    if duplicates:
+        collection.update_many(
+            {'_id': {'$in': duplicates}}, {'$unset': {'message_id': ''}}
+        )
+        logger.warning(
+            f'Unlinked {len(duplicates)} duplicate reports of messages'
+        )
+
+    try:
+        Report.ensure_indexes()
+    except OperationFailure:
+        logger.critical('Failed to build the report indexes')
+        raise
+
+
+async def migrate_reports():
+    await execute(_migrate_reports)
+
+
+async def enqueue_ban_jobs(
+    targets: Iterable[Tuple[int, int]], shard_count: int = 1
+) -> int:
+    now = datetime.utcnow()
+    operations = []
+    for guild_id, user_id in targets:
+        job = {
+            # Discord routes a guild to shard (id >> 22) % count
+            'shard_id': (guild_id >> 22) % shard_count,
+            'status': 'pending',
+            'attempts': 0,
+            'available_at': now,
+        }
+        key = {'user_id': user_id, 'guild_id': guild_id}
+
+        # Pending and leased jobs are left alone, so a job a worker holds
+        # is never handed to a second one. Finished jobs run again.
+        operations += [
+            UpdateOne(key, {'$setOnInsert': job}, upsert=True),
+            UpdateOne(
+                {**key, 'status': {'$in': ['done', 'failed']}},
+                {'$set': job, '$unset': {'outcome': '', 'completed': ''}},
+            ),
+        ]
+    if not operations:
+        return 0
+
+    # pylint: disable=protected-access
+    result = await execute(
+        lambda: BanJob._get_collection().bulk_write(operations, ordered=False)
+    )
+    return result.upserted_count + result.modified_count
+
+
+async def claim_ban_job(
+    worker_id: str, lease: timedelta, shard_ids: Optional[List[int]] = None
+) -> Optional[BanJob]:
+    now = datetime.utcnow()
+
+    filters = {}
+    if shard_ids is not None:
+        filters['shard_id__in'] = shard_ids
+
+    def claim() -> Optional[BanJob]:
+        # pylint: disable=no-member
+        query = BanJob.objects(
+            Q(status='pending', available_at__lte=now)
+            | Q(status='leased', lease_expires__lte=now),
+            **filters,
+        ).order_by('available_at')
+
+        return query.modify(
+            new=True,
+            set__status='leased',
+            set__lease_expires=now + lease,
+            set__worker_id=worker_id,
+            inc__attempts=1,
+        )
+
+    return await execute(claim)
+
+
+async def finish_ban_job(job: BanJob, *, status: str, **fields) -> bool:
+    update = {f'set__{field}': value for field, value in fields.items()}
+
+    def finish() -> int:
+        # pylint: disable=no-member
+        query = BanJob.objects(
+            id=job.id, status='leased', worker_id=job.worker_id
+        )
+        return query.update_one(
+            set__status=status, unset__lease_expires=True, **update
+        )
+
+    return bool(await execute(finish))
+
+
+async def count_ban_jobs() -> int:
+    # pylint: disable=no-member
+    return await execute(
+        lambda: BanJob.objects(status__in=('pending', 'leased')).count()
+    )
+
+
+async def find_reconcile_cursors(
+    guild_ids: List[int],
+) -> Dict[int, ReconcileCursor]:
+    # pylint: disable=no-member
+    cursors = await execute(
+        lambda: list(ReconcileCursor.objects(guild_id__in=guild_ids))
+    )
+    return {cursor.guild_id: cursor for cursor in cursors}
+
+
+async def publish_block_event(cluster_id: int, user_ids: List[int]):
+    await save(BlockEvent(user_ids=user_ids, cluster_id=cluster_id))
+
+
+async def find_block_events(
+    since: datetime, exclude_cluster_id: int
+) -> List[BlockEvent]:
+    # pylint: disable=no-member
+    return await execute(
+        lambda: list(
+            BlockEvent.objects(
+                timestamp__gte=since, cluster_id__ne=exclude_cluster_id
+            )
+        )
+    )
+
+
+async def find_feed_watermark(cluster_id: int) -> Optional[datetime]:
+    # pylint: disable=no-member
+    cursor = await execute(
+        lambda: FeedCursor.objects(cluster_id=cluster_id).first()
+    )
+    return cursor.watermark if cursor is not None else None
+
+
+async def update_feed_watermark(cluster_id: int, watermark: datetime):
+    # pylint: disable=no-member
+    await execute(
+        lambda: FeedCursor.objects(cluster_id=cluster_id).update_one(
+            upsert=True, set__watermark=watermark
+        )
+    )
+
+
+async def update_cluster_status(cluster_id: int, guilds: int, members: int):
+    # pylint: disable=no-member
+    now = datetime.utcnow()
+    await execute(
+        lambda: ClusterStatus.objects(cluster_id=cluster_id).update_one(
+            upsert=True,
+            set__guilds=guilds,
+            set__members=members,
+            set__updated_at=now,
+        )
+    )
+
+
+async def find_cluster_statuses(since: datetime) -> List[ClusterStatus]:
+    # pylint: disable=no-member
+    return await execute(
+        lambda: list(ClusterStatus.objects(updated_at__gte=since))
+    )
+
+
+def _record_moderation_events(
+    events: Dict[datetime, List[Dict]], rollups: Dict[datetime, Dict]
+):
+    appends = []
+    for day, day_events in events.items():
+        for i in range(0, len(day_events), BUCKET_SIZE):
+            chunk = day_events[i : i + BUCKET_SIZE]
+            appends.append(
+                UpdateOne(
+                    {'day': day, 'size': {'$lte': BUCKET_SIZE - len(chunk)}},
+                    {
+                        '$push': {'events': {'$each': chunk}},
+                        '$inc': {'size': len(chunk)},
+                    },
+                    upsert=True,
+                )
+            )
+
+    increments = [
+        UpdateOne({'_id': day}, {'$inc': counts}, upsert=True)
+        for day, counts in rollups.items()
+        if counts
+    ]
+
+    # pylint: disable=protected-access
+    if appends:
+        ModerationBucket._get_collection().bulk_write(appends)
+    if increments:
+        ModerationRollup._get_collection().bulk_write(increments)
+
+
+async def record_moderation_events(
+    events: Dict[datetime, List[Dict]], rollups: Dict[datetime, Dict]
+):
+    await execute(_record_moderation_events, events, rollups)
+
+
+async def find_moderation_rollups(since: datetime) -> List[ModerationRollup]:
+    return await execute(
+        lambda: list(_stale_reads(ModerationRollup)(day__gte=since))
+    )
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import csv
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    Dict,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+from loguru import logger
+
+from cluster import EXTERNAL_CLUSTER_ID
+from config import CONFIG
+from database import insert_blocks, publish_block_event, stream_blocks
+from modlog import MODLOG, block_event
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+FIELDS = ('user_id', 'reason', 'moderator_id', 'timestamp')
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+
+# Mongo stores integers as signed 64-bit
+MAX_USER_ID = 2**63 - 1
+
+
+class ImportResult(NamedTuple):
+    rows: int
+    inserted: int
+    invalid: int
+
+
+class ExportResult(NamedTuple):
+    rows: int
+
+
+def detect_format(path: Path) -> str:
+    try:
+        return FORMATS[path.suffix.lower()]
+    except KeyError:
+        raise ValueError(f'Unknown file format for {path}') from None
+
+
+def read_rows(f: TextIO, fmt: str) -> Iterator[Tuple[int, Union[Dict, str]]]:
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(f, 1):
+        if line.strip():
+            yield line_number, line
+
+
+def parse_block(
+    row: Union[Dict, str], reasons: Set[str], moderator_id: Optional[int]
+) -> Tuple[int, Dict]:
+    if isinstance(row, str):
+        row = json.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError('expected an object')
+
+    if not row.get('user_id'):
+        raise ValueError('missing user_id')
+    user_id = int(row['user_id'])
+    if not 0 < user_id <= MAX_USER_ID:
+        raise ValueError(f'invalid user_id {user_id}')
+
+    reason = row.get('reason')
+    if reason not in reasons:
+        raise ValueError(f'unknown reason {reason!r}')
+
+    moderator = row.get('moderator_id') or moderator_id
+    if not moderator:
+        raise ValueError('missing moderator_id')
+
+    return user_id, {'reason': reason, 'moderator_id': int(moderator)}
+
+
+async def _insert_batch(blocks: Dict[int, Dict]) -> int:
+    # Stamped at write time so running bots' index refreshes pick them up
+    now = datetime.utcnow()
+    for fields in blocks.values():
+        fields['timestamp'] = now
+
+    user_ids = await insert_blocks(blocks)
+
+    # Running bots find and ban these users when they see the event
+    if user_ids:
+        await publish_block_event(EXTERNAL_CLUSTER_ID, user_ids)
+
+    MODLOG.record(
+        block_event(user_id=user_id, **blocks[user_id]) for user_id in user_ids
+    )
+
+    return len(user_ids)
+
+
+async def import_blocks(
+    f: TextIO,
+    fmt: str,
+    *,
+    moderator_id: Optional[int] = None,
+    batch_size: int = BATCH_SIZE,
+) -> ImportResult:
+    reasons = set(CONFIG.reason_titles)
+    rows = inserted = invalid = 0
+
+    blocks: Dict[int, Dict] = {}
+    pending: Optional[asyncio.Future] = None
+
+    # Parse the next batch while the previous one is being written
+    for line_number, row in read_rows(f, fmt):
+        rows += 1
+        try:
+            user_id, fields = parse_block(row, reasons, moderator_id)
+        except (TypeError, ValueError) as e:
+            invalid += 1
+            if invalid <= MAX_REPORTED_ERRORS:
+                logger.warning(f'Skipping line {line_number}: {e}')
+            continue
+
+        blocks[user_id] = fields
+        if len(blocks) < batch_size:
+            continue
+
+        write = asyncio.ensure_future(_insert_batch(blocks))
+        blocks = {}
+        if pending is not None:
+            inserted += await pending
+        pending = write
+
+    if pending is not None:
+        inserted += await pending
+    inserted += await _insert_batch(blocks)
+
+    if invalid > MAX_REPORTED_ERRORS:
+        logger.warning(
+            f'Skipped {invalid - MAX_REPORTED_ERRORS} more invalid lines'
+        )
+
+    return ImportResult(rows, inserted, invalid)
+
+
+def _format_block(document: Dict) -> Dict:
+    return {
+        'user_id': document['_id'],
+        'reason': document['reason'],
+        'moderator_id': document['moderator_id'],
+        'timestamp': document['timestamp'].isoformat(),
+    }
+
+
+async def export_blocks(
+    f: TextIO,
+    fmt: str,
+    *,
+    reason: Optional[str] = None,
+    batch_size: int = BATCH_SIZE,
+) -> ExportResult:
+    filters = {} if reason is None else {'reason': reason}
+    rows = 0
+
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+
+    async for batch in stream_blocks(batch_size, **filters):
+        blocks = map(_format_block, batch)
+        if fmt == 'csv':
+            writer.writerows(blocks)
+        else:
+            f.writelines(json.dumps(block) + '\n' for block in blocks)
+        rows += len(batch)
+
+    return ExportResult(rows)
+
+
+async def run(args: argparse.Namespace):
+    started = time.perf_counter()
+
+    if args.command == 'import':
+        with args.path.open(encoding='utf-8-sig', newline='') as f:
+            result = await import_blocks(
+                f,
+                args.format,
+                moderator_id=args.moderator,
+                batch_size=args.batch_size,
+            )
+        # Block history is buffered, so write out the last of it
+        await MODLOG.stop()
+        summary = (
+            f'Imported {result.inserted} of {result.rows} rows '
+            f'({result.invalid} invalid)'
+        )
+    else:
+        with args.path.open('w', encoding='utf-8', newline='') as f:
+            result = await export_blocks(
+                f, args.format, reason=args.reason, batch_size=args.batch_size
+            )
+        summary = f'Exported {result.rows} rows'
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f'{summary} in {elapsed:.1f}s '
+        f'({result.rows / max(elapsed, 1e-9):.0f} rows/s)'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Import or export the blocklist as CSV or JSON lines'
+    )
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('path', type=Path)
+    parser.add_argument('--format', choices=sorted(set(FORMATS.values())))
+    parser.add_argument(
+        '--moderator',
+        type=int,
+        help='moderator ID for imported rows that have none',
+    )
+    parser.add_argument('--reason', help='only export blocks for this reason')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    args = parser.parse_args()
+    if args.format is None:
+        try:
+            args.format = detect_format(args.path)
+        except ValueError as e:
+            parser.error(str(e))
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import asyncio
+import random
+from typing import Optional
+
+from loguru import logger
+from topgg import DBLClient
+
+from cluster import CLUSTER
+from config import CONFIG
+
+
+class GuildCountPublisher:
+    # Guild joins and removes only mark the count as dirty. A single task
+    # posts it at most once per interval, so a mass kick or a reconnect
+    # costs one request instead of one per event.
+    def __init__(self, dblclient: DBLClient):
+        self.dblclient = dblclient
+        self.posted: Optional[int] = None
+        self._dirty = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        # Changes still waiting out the interval would otherwise be lost
+        if self._dirty.is_set():
+            await self.post()
+
+    async def post(self) -> bool:
+        self._dirty.clear()
+
+        # One cluster posts the total so they don't overwrite each other
+        guilds = CLUSTER.guilds
+        if not CLUSTER.primary or guilds == self.posted:
+            return True
+
+        try:
+            await self.dblclient.post_guild_count(guilds, CLUSTER.shard_count)
+        except Exception:
+            logger.exception('Failed to post server count')
+            self._dirty.set()
+            return False
+
+        self.posted = guilds
+        logger.trace(f'Posted server count ({guilds})')
+        return True
+
+    async def _run(self):
+        failures = 0
+        while True:
+            await self._dirty.wait()
+
+            if await self.post():
+                failures = 0
+                delay = CONFIG.topgg.post_interval
+            else:
+                # Jittered so restarted clusters don't retry in lockstep
+                failures += 1
+                delay = min(
+                    CONFIG.topgg.retry_delay * 2 ** (failures - 1),
+                    CONFIG.topgg.post_interval,
+                ) * random.uniform(0.5, 1)
+
+            await asyncio.sleep(delay)
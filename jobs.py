@@ -0,0 +1,168 @@
+import asyncio
+import random
+from collections import deque
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from discord import Client
+from discord.errors import HTTPException
+from loguru import logger
+
+from config import CONFIG
+from database import (
+    BanJob,
+    claim_ban_job,
+    count_ban_jobs,
+    enqueue_ban_jobs,
+    find_block,
+    finish_ban_job,
+)
+from metrics import BAN_JOBS_ACTIVE, BAN_OUTCOMES, BAN_TARGETS
+from propagation import BanOutcome, ban_in_guild, is_retryable
+
+THROUGHPUT_WINDOW = 60
+
+
+class BanQueue:
+    def __init__(
+        self,
+        client: Client,
+        *,
+        shard_ids: Optional[List[int]] = None,
+        shard_count: int = 1,
+    ):
+        self.client = client
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.worker_id = uuid4().hex
+        self.lease = timedelta(seconds=CONFIG.queue.lease)
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._completed = deque()
+
+    @property
+    def throughput(self) -> float:
+        cutoff = monotonic() - THROUGHPUT_WINDOW
+        while self._completed and self._completed[0] < cutoff:
+            self._completed.popleft()
+
+        return len(self._completed) / THROUGHPUT_WINDOW
+
+    async def depth(self) -> int:
+        return await count_ban_jobs()
+
+    async def enqueue(self, targets: Iterable[Tuple[int, int]]) -> int:
+        queued = await enqueue_ban_jobs(targets, self.shard_count)
+        if queued:
+            BAN_TARGETS.inc(queued)
+            self._wakeup.set()
+
+        return queued
+
+    def start(self):
+        if self._workers:
+            return
+
+        self._workers = [
+            asyncio.create_task(self._work())
+            for _ in range(CONFIG.queue.workers)
+        ]
+        logger.info(f'Started {len(self._workers)} ban queue workers')
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self):
+        while True:
+            try:
+                job = await claim_ban_job(
+                    self.worker_id, self.lease, self.shard_ids
+                )
+            except Exception:
+                logger.exception('Failed to claim ban job')
+                job = None
+
+            if job is None:
+                await self._idle()
+                continue
+
+            BAN_JOBS_ACTIVE.inc()
+            try:
+                await self._process(job)
+            except Exception:
+                # The lease runs out and another worker picks the job up
+                logger.exception(f'Failed to record ban job {job.id}')
+            finally:
+                BAN_JOBS_ACTIVE.dec()
+
+    async def _idle(self):
+        self._wakeup.clear()
+
+        try:
+            await asyncio.wait_for(
+                self._wakeup.wait(), CONFIG.queue.poll_interval
+            )
+        except asyncio.TimeoutError:
+            pass
+
+    async def _process(self, job: BanJob):
+        try:
+            outcome = await self._run(job)
+        except HTTPException as exc:
+            if not is_retryable(exc):
+                logger.warning(f'Ban job {job.id} failed: {exc}')
+                await self._fail(job)
+                return
+
+            await self._retry(job, exc)
+            return
+        except Exception as exc:
+            logger.exception(f'Ban job {job.id} raised')
+            await self._retry(job, exc)
+            return
+
+        await finish_ban_job(
+            job,
+            status='done',
+            outcome=outcome.value,
+            completed=datetime.utcnow(),
+        )
+        self._completed.append(monotonic())
+        BAN_OUTCOMES.labels(outcome=outcome.value).inc()
+
+    async def _run(self, job: BanJob) -> BanOutcome:
+        guild = self.client.get_guild(job.guild_id)
+        block = await find_block(job.user_id)
+
+        # Left the guild or the user was unblocked since the job was queued
+        if guild is None or block is None:
+            return BanOutcome.SKIPPED
+
+        return await ban_in_guild(self.client, guild, block)
+
+    async def _retry(self, job: BanJob, exc: Exception):
+        if job.attempts >= CONFIG.queue.max_attempts:
+            logger.error(f'Giving up on ban job {job.id}: {exc}')
+            await self._fail(job)
+            return
+
+        delay = CONFIG.queue.backoff * 2 ** (job.attempts - 1)
+        delay *= random.uniform(0.5, 1.5)
+
+        await finish_ban_job(
+            job,
+            status='pending',
+            available_at=datetime.utcnow() + timedelta(seconds=delay),
+        )
+
+    async def _fail(self, job: BanJob):
+        await finish_ban_job(
+            job, status='failed', outcome=BanOutcome.FAILED.value
+        )
+        BAN_OUTCOMES.labels(outcome=BanOutcome.FAILED.value).inc()
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Dict, List, Tuple
+
+from discord import Client, Guild, Member
+from loguru import logger
+
+from blocklist import BLOCKLIST
+from config import CONFIG
+from database import find_blocks
+from propagation import ban_members, ban_user, notify_later
+
+
+class JoinBatcher:
+    def __init__(self, client: Client):
+        self.client = client
+        self._batches: Dict[int, Tuple[List[Member], asyncio.Task]] = {}
+
+    async def submit(self, member: Member):
+        guild = member.guild
+
+        # Joins landing within the delay share one lookup and one ban
+        # request, which matters when a raid floods a guild
+        batch = self._batches.get(guild.id)
+        if batch is None:
+            members = []
+            task = asyncio.ensure_future(self._flush(guild, members))
+            batch = self._batches[guild.id] = (members, task)
+
+        batch[0].append(member)
+        await asyncio.shield(batch[1])
+
+    async def _flush(self, guild: Guild, members: List[Member]):
+        await asyncio.sleep(CONFIG.joins.batch_delay)
+        del self._batches[guild.id]
+
+        members = {member.id: member for member in members}
+        blocks = await find_blocks(list(members))
+
+        for user_id in members.keys() - blocks.keys():
+            BLOCKLIST.discard(user_id)
+
+        if not blocks:
+            return
+
+        targets = [members[user_id] for user_id in blocks]
+        if len(targets) == 1:
+            member = targets[0]
+            await ban_user(self.client, guild, member, blocks[member.id])
+            logger.debug(f'{member} joined {guild}, banned due to block')
+            return
+
+        banned = await ban_members(self.client, guild, targets, blocks)
+        logger.info(f'Banned {len(banned)} blocked users who joined {guild}')
+
+        # DMs would only compete with the bans for rate limits in a raid
+        if len(targets) < CONFIG.joins.raid_size:
+            for member in banned:
+                notify_later(guild, member, blocks[member.id])
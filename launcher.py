@@ -0,0 +1,69 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+from loguru import logger
+
+from config import CLUSTER_ENV, CONFIG
+
+MAIN_PATH = Path(__file__).parent / 'main.py'
+RESTART_DELAY = 10
+
+
+def spawn(cluster_id: int) -> subprocess.Popen:
+    logger.info(f'Starting cluster {cluster_id}')
+    return subprocess.Popen(
+        [sys.executable, str(MAIN_PATH)],
+        env={**os.environ, CLUSTER_ENV: str(cluster_id)},
+    )
+
+
+def main():
+    processes: Dict[int, subprocess.Popen] = {
+        cluster_id: spawn(cluster_id)
+        for cluster_id in range(CONFIG.cluster.clusters)
+    }
+    restarts: Dict[int, float] = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while processes:
+        time.sleep(1)
+
+        for cluster_id, process in list(processes.items()):
+            if process.poll() is None:
+                continue
+
+            if stopping:
+                del processes[cluster_id]
+                continue
+
+            # Wait a little so a crashing cluster doesn't hammer the gateway
+            if cluster_id not in restarts:
+                logger.warning(
+                    f'Cluster {cluster_id} exited with {process.returncode}'
+                )
+                restarts[cluster_id] = time.monotonic() + RESTART_DELAY
+            if time.monotonic() < restarts[cluster_id]:
+                continue
+
+            del restarts[cluster_id]
+            processes[cluster_id] = spawn(cluster_id)
+
+    logger.info('All clusters stopped')
+
+
+if __name__ == '__main__':
+    main()
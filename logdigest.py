@@ -0,0 +1,151 @@
+import asyncio
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+from discord import Client, Embed
+from discord.errors import HTTPException
+from discord.http import Route
+from loguru import logger
+
+from config import CONFIG
+from ratelimit import SCHEDULER, Priority
+
+EMBED_DESCRIPTION_LIMIT = 4096
+MESSAGE_EMBED_LIMIT = 10
+MESSAGE_EMBED_LENGTH = 6000
+
+
+def chunk_lines(lines: Iterable[str], limit: int) -> Iterator[str]:
+    chunk = ''
+    for line in lines:
+        if chunk and len(chunk) + len(line) + 1 > limit:
+            yield chunk
+            chunk = ''
+        chunk = f'{chunk}\n{line}' if chunk else line
+
+    if chunk:
+        yield chunk
+
+
+class LogEntry(NamedTuple):
+    group: str
+    embed: Embed
+    line: str
+    publish: bool
+
+
+class LogDigest:
+    # Log posts to a channel are buffered for a short interval and sent as
+    # digests of up to ten embeds, or as compact tables for larger bursts,
+    # so a wave of events doesn't use up the channel rate limits that
+    # block and report logs share.
+    def __init__(self):
+        self._pending: Dict[int, List[LogEntry]] = {}
+        self._flushes: Dict[int, asyncio.Task] = {}
+
+    def post(
+        self,
+        client: Client,
+        channel_id: int,
+        *,
+        group: str,
+        embed: Embed,
+        line: str,
+        publish: bool = False,
+    ):
+        entry = LogEntry(group, embed, line, publish)
+        self._pending.setdefault(channel_id, []).append(entry)
+
+        if channel_id not in self._flushes:
+            self._flushes[channel_id] = asyncio.ensure_future(
+                self._flush_later(client, channel_id)
+            )
+
+    async def stop(self, client: Client):
+        for flush in self._flushes.values():
+            flush.cancel()
+        self._flushes = {}
+
+        await asyncio.gather(
+            *(self._flush(client, channel_id) for channel_id in self._pending)
+        )
+
+    async def _flush_later(self, client: Client, channel_id: int):
+        await asyncio.sleep(CONFIG.logs.flush_interval)
+        del self._flushes[channel_id]
+        await self._flush(client, channel_id)
+
+    async def _flush(self, client: Client, channel_id: int):
+        entries = self._pending.pop(channel_id)
+
+        try:
+            channel = client.get_channel(channel_id)
+            for embeds, publish in self._render(entries):
+                await self._send(client, channel, embeds, publish)
+        except HTTPException:
+            logger.warning(f'Failed to send {len(entries)} log entries')
+        except Exception:
+            logger.exception(f'Failed to send {len(entries)} log entries')
+
+    async def _send(
+        self, client: Client, channel, embeds: List[Embed], publish: bool
+    ):
+        # discord.py 1.7 can only send one embed per message
+        route = Route(
+            'POST', '/channels/{channel_id}/messages', channel_id=channel.id
+        )
+        async with SCHEDULER.slot(Priority.LOG, channel.id):
+            data = await client.http.request(
+                route, json={'embeds': [embed.to_dict() for embed in embeds]}
+            )
+
+        if publish:
+            message = channel.get_partial_message(int(data['id']))
+            async with SCHEDULER.slot(Priority.LOG, channel.id):
+                await message.publish()
+
+    def _render(
+        self, entries: List[LogEntry]
+    ) -> Iterator[Tuple[List[Embed], bool]]:
+        if len(entries) > CONFIG.logs.table_threshold:
+            embeds = self._tables(entries)
+            publish = any(entry.publish for entry in entries)
+            for embed in embeds:
+                yield [embed], publish
+            return
+
+        embeds = []
+        length = 0
+        publish = False
+        for entry in entries:
+            if embeds and (
+                len(embeds) == MESSAGE_EMBED_LIMIT
+                or length + len(entry.embed) > MESSAGE_EMBED_LENGTH
+            ):
+                yield embeds, publish
+                embeds = []
+                length = 0
+                publish = False
+
+            embeds.append(entry.embed)
+            length += len(entry.embed)
+            publish |= entry.publish
+
+        if embeds:
+            yield embeds, publish
+
+    def _tables(self, entries: List[LogEntry]) -> Iterator[Embed]:
+        groups: Dict[str, List[LogEntry]] = {}
+        for entry in entries:
+            groups.setdefault(entry.group, []).append(entry)
+
+        for group, grouped in groups.items():
+            lines = [entry.line for entry in grouped]
+            for description in chunk_lines(lines, EMBED_DESCRIPTION_LIMIT):
+                yield Embed(
+                    title=f'{group} ({len(grouped)})',
+                    description=description,
+                    color=grouped[0].embed.color,
+                )
+
+
+LOGS = LogDigest()
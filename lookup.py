@@ -0,0 +1,82 @@
+import asyncio
+from datetime import timezone
+from typing import Dict, List, NamedTuple, Optional
+
+from discord import Client, User
+from discord.errors import NotFound
+
+from config import CONFIG
+from database import Block, count_open_reports, find_blocks
+from users import USERS
+
+# Keeps a lookup to a handful of result pages
+LOOKUP_LIMIT = 100
+
+
+class Lookup(NamedTuple):
+    user_id: int
+    block: Optional[Block]
+    open_reports: int
+
+    @property
+    def immune(self) -> bool:
+        return self.user_id in CONFIG.immune
+
+
+async def lookup_users(user_ids: List[int]) -> List[Lookup]:
+    # One query per collection however many users are looked up
+    blocks, open_reports = await asyncio.gather(
+        find_blocks(user_ids, stale=True), count_open_reports(user_ids)
+    )
+
+    return [
+        Lookup(user_id, blocks.get(user_id), open_reports.get(user_id, 0))
+        for user_id in user_ids
+    ]
+
+
+async def resolve_moderators(
+    client: Client, lookups: List[Lookup]
+) -> Dict[int, User]:
+    moderator_ids = {
+        lookup.block.moderator_id
+        for lookup in lookups
+        if lookup.block is not None
+    }
+
+    async def resolve(user_id: int) -> Optional[User]:
+        try:
+            return await USERS.resolve(client, user_id)
+        except NotFound:
+            return None
+
+    moderators = await asyncio.gather(*map(resolve, moderator_ids))
+    return {
+        user_id: moderator
+        for user_id, moderator in zip(moderator_ids, moderators)
+        if moderator is not None
+    }
+
+
+def format_lookup(lookup: Lookup, moderators: Dict[int, User]) -> str:
+    parts = [f'<@{lookup.user_id}> (`{lookup.user_id}`)']
+
+    block = lookup.block
+    if block is None:
+        parts.append('not blocked')
+    else:
+        timestamp = int(
+            block.timestamp.replace(tzinfo=timezone.utc).timestamp()
+        )
+        moderator = moderators.get(block.moderator_id, block.moderator_id)
+        parts.append(
+            f'**{CONFIG.reason_titles.get(block.reason, block.reason)}** '
+            f'by `{moderator}` <t:{timestamp}:R>'
+        )
+
+    if lookup.open_reports:
+        parts.append(f'{lookup.open_reports} open reports')
+    if lookup.immune:
+        parts.append('immune')
+
+    return ' · '.join(parts)
@@ -1,5 +1,5 @@
 from datetime import datetime, timezone
-from glob import glob
+from typing import Dict, List, Tuple
 from uuid import uuid4
 
 import sentry_sdk
@@ -13,31 +13,95 @@ from discord import (
     Member,
     Message,
 )
-from discord.errors import Forbidden
-from discord.ext.commands import Bot
+from discord.ext import tasks
+from discord.ext.commands import AutoShardedBot
 from discord_slash import ComponentContext, MenuContext, SlashCommand, SlashContext
 from discord_slash.model import ContextMenuType, SlashCommandOptionType
-from discord_slash.utils.manage_commands import create_choice, create_option
+from discord_slash.utils.manage_commands import create_option
 from loguru import logger
+from mongoengine import NotUniqueError
 from topgg import DBLClient
 
-from config import CONFIG
-from database import Block, Report
+from blocklist import BLOCKLIST
+from cluster import CLUSTER
+from config import CONFIG, reload_config
+from database import (
+    Report,
+    ReportCard,
+    execute,
+    has_open_report,
+    migrate_reports,
+    save,
+)
+from guildcount import GuildCountPublisher
+from jobs import BanQueue
+from joins import JoinBatcher
+from logdigest import LOGS
+from lookup import (
+    LOOKUP_LIMIT,
+    format_lookup,
+    lookup_users,
+    resolve_moderators,
+)
+from metrics import (
+    BAN_QUEUE_DEPTH,
+    BAN_QUEUE_THROUGHPUT,
+    OUTBOUND_QUEUE_DEPTH,
+    instrument,
+    instrument_client,
+    start_metrics_server,
+)
+from modlog import MAX_DAYS, MODLOG, report_event, summarize
+from propagation import find_targets
+from ratelimit import SCHEDULER, Priority
+from reconcile import (
+    SWEEP_THRESHOLD,
+    DriftReconciler,
+    reconcile_guild,
+    sweep_guilds,
+)
+from reports import REPORTS
+from stats import STATS
+from users import USERS
 from utils import (
-    REASONS_DICT,
+    EMBED_DESCRIPTION_LIMIT,
     Permissions,
-    ban_user,
+    chunk_lines,
     create_block,
+    create_blocks,
+    format_guild_line,
     format_user_info,
     make_report_actionrows,
-    send_report_embed,
+    reason_choices,
+    resolve_users,
 )
 
 sentry_sdk.init(CONFIG.sentry.dsn)
 
+
+class Blockbot(AutoShardedBot):
+    async def start(self, *args, **kwargs):
+        # Before any events, so duplicate message reports can't slip in
+        # while the unique index is missing
+        await migrate_reports()
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        # Flush pending guild counts and logs before the connection goes away
+        await self.guild_count.stop()
+        await MODLOG.stop()
+        await LOGS.stop(self)
+        await super().close()
+
+
 intents = Intents.default()
 intents.members = True  # pylint: disable=assigning-non-slot
-client = Bot(command_prefix=uuid4().hex, intents=intents)
+client = Blockbot(
+    command_prefix=uuid4().hex,
+    intents=intents,
+    shard_count=CLUSTER.shard_count,
+    shard_ids=CLUSTER.shard_ids,
+)
 slash = SlashCommand(
     client,
     # Uncomment if commands are added/removed or paramters are changed:
@@ -45,103 +109,234 @@ slash = SlashCommand(
 )
 
 client.topggpy = DBLClient(client, CONFIG.topgg.token)
+client.guild_count = GuildCountPublisher(client.topggpy)
+client.ban_queue = BanQueue(
+    client,
+    # A lone cluster owns every shard, including jobs queued before sharding
+    shard_ids=CLUSTER.shard_ids if CLUSTER.clustered else None,
+    shard_count=CLUSTER.shard_count,
+)
+client.join_batcher = JoinBatcher(client)
+client.drift_reconciler = DriftReconciler(client)
+client.metrics_server = None
+
+instrument_client(client)
+
+
+@tasks.loop(seconds=CONFIG.blocklist.refresh_interval)
+async def refresh_blocklist():
+    try:
+        await execute(BLOCKLIST.refresh)
+    except:
+        logger.exception('Failed to refresh blocklist index')
+
+
+@tasks.loop(seconds=CONFIG.blocklist.snapshot_interval)
+async def save_blocklist_snapshot():
+    try:
+        await execute(BLOCKLIST.save_snapshot)
+    except:
+        logger.exception('Failed to save blocklist snapshot')
+
+
+@tasks.loop(seconds=CONFIG.stats.reconcile_interval)
+async def reconcile_stats():
+    try:
+        await STATS.reconcile(client.guilds)
+    except:
+        logger.exception('Failed to reconcile stats')
+
+
+@tasks.loop(seconds=CONFIG.reconcile.drift_interval)
+async def reconcile_drift():
+    try:
+        await client.drift_reconciler.run()
+    except:
+        logger.exception('Failed to reconcile ban drift')
+
+
+@tasks.loop(seconds=CONFIG.cluster.feed_interval)
+async def follow_block_feed():
+    try:
+        user_ids = await CLUSTER.poll()
+        if not user_ids:
+            return
+
+        for user_id in user_ids:
+            BLOCKLIST.add(user_id)
+
+        # Bulk imports arrive here a thousand users per event
+        if len(user_ids) > SWEEP_THRESHOLD:
+            queued = await sweep_guilds(client, user_ids)
+        else:
+            targets = await find_targets(client, user_ids)
+            queued = await client.ban_queue.enqueue(targets)
+        logger.info(
+            f'Queued {queued} bans for {len(user_ids)} blocks from the feed'
+        )
+
+        # Only once they're queued, so a restart reads them again otherwise
+        await CLUSTER.save_watermark()
+    except:
+        logger.exception('Failed to follow block feed')
+
+
+@tasks.loop(seconds=CONFIG.cluster.status_interval)
+async def sync_cluster_status():
+    try:
+        await CLUSTER.sync_status()
+
+        # Other clusters' guilds count towards the total we post
+        client.guild_count.mark_dirty()
+    except:
+        logger.exception('Failed to sync cluster status')
+
+
+@tasks.loop(seconds=30)
+async def watch_config():
+    try:
+        reload_config()
+    except:
+        logger.exception('Failed to reload config')
 
 
-async def post_guild_count():
+@tasks.loop(seconds=15)
+async def collect_metrics():
     try:
-        await client.topggpy.post_guild_count()
-        logger.trace(f'Posted server count ({client.topggpy.guild_count})')
+        BAN_QUEUE_DEPTH.set(await client.ban_queue.depth())
+        BAN_QUEUE_THROUGHPUT.set(client.ban_queue.throughput)
+        for priority in Priority:
+            OUTBOUND_QUEUE_DEPTH.labels(priority=priority.name.lower()).set(
+                SCHEDULER.depth(priority)
+            )
     except:
-        logger.exception('Failed to post server count')
+        logger.exception('Failed to collect metrics')
 
 
 @client.event
+@instrument('event')
 async def on_ready():
     client.started = datetime.utcnow()
+    if not refresh_blocklist.is_running():
+        refresh_blocklist.start()
+    if not save_blocklist_snapshot.is_running():
+        save_blocklist_snapshot.start()
+    if not reconcile_stats.is_running():
+        reconcile_stats.start()
+    if not reconcile_drift.is_running():
+        reconcile_drift.start()
+    if not watch_config.is_running():
+        watch_config.start()
+    if not collect_metrics.is_running():
+        collect_metrics.start()
+    # Imports publish to the feed even when there's only one cluster
+    if not follow_block_feed.is_running():
+        follow_block_feed.start()
+    if CLUSTER.clustered and not sync_cluster_status.is_running():
+        sync_cluster_status.start()
+    if client.metrics_server is None:
+        # Clusters sharing a host each need their own port
+        client.metrics_server = await start_metrics_server(
+            CONFIG.metrics.host, CONFIG.metrics.port + CLUSTER.cluster_id
+        )
+    client.ban_queue.start()
+    client.guild_count.start()
+    client.guild_count.mark_dirty()
     await client.change_presence(
         activity=Activity(type=ActivityType.watching, name='/report')
     )
-    await post_guild_count()
     logger.info(f'Ready as {client.user}')
 
 
 @client.event
+@instrument('event')
 async def on_component(ctx: ComponentContext):
     if not ctx.custom_id.startswith('reportaction_'):
         return
 
-    _, report_id, action = ctx.custom_id.split('_')
+    # Discord can deliver the same interaction more than once
+    if not REPORTS.first_delivery(ctx.interaction_id):
+        return
 
-    report = Report.objects.get(id=report_id)  # pylint: disable=no-member
+    _, card_id, action = ctx.custom_id.split('_')
 
-    if action == 'ignore':
-        report.reviewed = True
-        report.save()
+    # Claim the card before any side effects, so simultaneous clicks by
+    # several moderators only act once
+    flag = 'asked' if action == 'askinfo' else 'closed'
+    card = await REPORTS.claim(
+        card_id, flag, ctx.channel_id, ctx.origin_message_id
+    )
+    if card is None:
+        await ctx.send('This report has already been handled.', hidden=True)
+        return
 
-        await ctx.edit_origin(
-            content=f'Ignored by {ctx.author.mention}', components=[]
+    try:
+        # The action can outlast Discord's 3 second response deadline
+        await ctx.defer(edit_origin=True)
+        content, components = await handle_report_action(ctx, card, action)
+    except Exception:
+        # Nothing was done yet, so give the card back so its reports aren't
+        # stranded and another click can retry
+        await REPORTS.release(card, flag)
+        await ctx.send(
+            'Failed to handle this report, please try again.', hidden=True
         )
-    elif action == 'askinfo':
-        user = await client.fetch_user(report.reporter_id)
+        raise
 
-        embed = Embed(
-            title='Please provide us with more information',
-            description=f"Hey, {user.mention}! We've reviewed your report and "
-            'think we need a little more information or evidence.',
-        )
-        embed.add_field(
-            name='Next steps',
-            value='Please join our mail server at '
-            f'https://discord.gg/{CONFIG.server.appeals_invite} and create a '
-            'ticket to provide us more info. Thank you!',
-        )
-        embed.set_footer(text=f'Report ID: {report.id}')
+    await ctx.edit_origin(content=content, components=components)
 
-        try:
-            await user.send(embed=embed)
 
-            await ctx.edit_origin(
-                content='Successfully asked for more info by '
-                f'{ctx.author.mention}',
-                components=make_report_actionrows(
-                    report_id, askinfo_disabled=True
-                ),
-            )
-        except Forbidden:
-            await ctx.edit_origin(
-                content=f'Failed to ask for more info by {ctx.author.mention}',
-                components=make_report_actionrows(
-                    report_id, askinfo_disabled=True
-                ),
-            )
+async def handle_report_action(
+    ctx: ComponentContext, card: ReportCard, action: str
+) -> Tuple[str, List[Dict]]:
+    if action == 'ignore':
+        await REPORTS.review(card, ctx.author.id)
+
+        return f'Ignored by {ctx.author.mention}', []
+    elif action == 'askinfo':
+        reporter_ids = await REPORTS.find_reporters(card)
+
+        # The card stays open so later reports still reach the block action
+        await REPORTS.review(card, ctx.author.id)
+
+        REPORTS.ask_for_info(client, card, reporter_ids)
+        content = (
+            f'Asking {len(reporter_ids)} reporters for more info by '
+            f'{ctx.author.mention}'
+        )
 
-        report.reviewed = True
-        report.save()
+        return content, make_report_actionrows(
+            str(card.id), askinfo_disabled=True
+        )
     elif action == 'block':
         reason = ctx.selected_options[0]
 
+        # Reviewed first, so the block is the last step and a failure
+        # before it leaves nothing to repeat
+        await REPORTS.review(card, ctx.author.id)
+
         await create_block(
             client,
-            user_id=report.user_id,
+            user_id=card.user_id,
             reason=reason,
             moderator_id=ctx.author.id,
         )
 
-        report.reviewed = True
-        report.save()
-
-        await ctx.edit_origin(
-            content=f'Blocked by {ctx.author.mention} for '
-            f'{REASONS_DICT[reason]}',
-            components=[],
+        content = (
+            f'Blocked by {ctx.author.mention} for '
+            f'{CONFIG.reason_titles[reason]}'
         )
+        return content, []
+
+    raise ValueError(f'Unknown report action {action}')
 
 
 @client.event
+@instrument('event')
 async def on_guild_join(guild: Guild):
     logger.info(f'Joined guild {guild.name}')
-
-    channel = client.get_channel(CONFIG.server.channels.server_joins)
+    STATS.record_guild_join(guild)
+    client.guild_count.mark_dirty()
 
     embed = Embed(title=f'Joined {guild.name}', color=Color.green())
 
@@ -153,16 +348,23 @@ async def on_guild_join(guild: Guild):
     timestamp = int(guild.created_at.replace(tzinfo=timezone.utc).timestamp())
     embed.add_field(name='Created', value=f'<t:{timestamp}:R>')
 
-    await channel.send(embed=embed)
+    LOGS.post(
+        client,
+        CONFIG.server.channels.server_joins,
+        group='Joined servers',
+        embed=embed,
+        line=format_guild_line(guild),
+    )
 
-    await post_guild_count()
+    await reconcile_guild(client, guild)
 
 
 @client.event
+@instrument('event')
 async def on_guild_remove(guild: Guild):
     logger.info(f'Left guild {guild.name}')
-
-    channel = client.get_channel(CONFIG.server.channels.server_leaves)
+    STATS.record_guild_remove(guild)
+    client.guild_count.mark_dirty()
 
     embed = Embed(title=f'Left {guild.name}', color=Color.red())
 
@@ -174,36 +376,44 @@ async def on_guild_remove(guild: Guild):
     timestamp = int(guild.created_at.replace(tzinfo=timezone.utc).timestamp())
     embed.add_field(name='Created', value=f'<t:{timestamp}:R>')
 
-    await channel.send(embed=embed)
-
-    await post_guild_count()
+    LOGS.post(
+        client,
+        CONFIG.server.channels.server_leaves,
+        group='Left servers',
+        embed=embed,
+        line=format_guild_line(guild),
+    )
 
 
 @client.event
+@instrument('event')
 async def on_member_join(member: Member):
     guild = member.guild
 
-    try:
-        # pylint: disable=no-member
-        Block.objects.get(user_id=member.id)
-        if guild.id not in CONFIG.noban_servers:
-            logger.debug(f'{member} joined {guild}, banning due to block')
-            await ban_user(client, guild, member)
-    except Block.DoesNotExist:
-        pass
+    if guild.id in CONFIG.noban_servers:
+        return
+
+    # Until the index has loaded, the batch lookup checks every join
+    if BLOCKLIST.loaded and member.id not in BLOCKLIST:
+        return
+
+    await client.join_batcher.submit(member)
 
 
 @slash.slash(name='ping', description='See if the bot is alive')
+@instrument('command')
 async def ping_command(ctx: SlashContext):
     await ctx.send("I'm alive!", hidden=True)
 
 
 @slash.slash(name='server', description='Join our community/support server')
+@instrument('command')
 async def server_command(ctx: SlashContext):
     await ctx.send(f'https://discord.gg/{CONFIG.server.invite}', hidden=True)
 
 
 @slash.slash(name='appeal', description='Join our appeals server')
+@instrument('command')
 async def appeal_command(ctx: SlashContext):
     await ctx.send(
         f'https://discord.gg/{CONFIG.server.appeals_invite}', hidden=True
@@ -215,6 +425,7 @@ async def appeal_command(ctx: SlashContext):
     description='See information about Blockbot',
     guild_ids=[CONFIG.server.id],
 )
+@instrument('command')
 async def stats_command(ctx: SlashContext):
     await ctx.defer(hidden=True)
 
@@ -223,26 +434,30 @@ async def stats_command(ctx: SlashContext):
     embed.set_thumbnail(url=client.user.avatar_url)
 
     embed.add_field(
-        name='Server count', value=f'**`{len(client.guilds)}`** servers'
+        name='Server count', value=f'**`{CLUSTER.guilds}`** servers'
     )
-
-    members = sum(guild.member_count for guild in client.guilds)
-    embed.add_field(name='Total members', value=f'**`{members}`** members')
-
-    # pylint: disable=no-member
     embed.add_field(
-        name='Blocked', value=f'**`{Block.objects.count()}`** users'
+        name='Total members', value=f'**`{CLUSTER.members}`** members'
     )
+    embed.add_field(name='Blocked', value=f'**`{STATS.blocks}`** users')
+    embed.add_field(name='Reports', value=f'**`{STATS.reports}`** reports')
     embed.add_field(
-        name='Reports', value=f'**`{Report.objects.count()}`** reports'
+        name='Code amount',
+        value=f'**`{STATS.lines_of_code}`** lines of Python',
     )
 
-    lines_of_code = sum(
-        sum(line.strip() != '' for line in open(source_path))
-        for source_path in glob('*.py')
+    top_reasons = '\n'.join(
+        f'{CONFIG.reason_titles.get(reason, reason)}: **`{count}`**'
+        for reason, count in STATS.blocks_by_reason.most_common(5)
     )
     embed.add_field(
-        name='Code amount', value=f'**`{lines_of_code}`** lines of Python'
+        name='Top block reasons', value=top_reasons or 'None', inline=False
+    )
+
+    latency_minutes = STATS.average_review_latency / 60
+    embed.add_field(
+        name='Review time',
+        value=f'**`{latency_minutes:.1f}`** minutes on average',
     )
 
     start_timestamp = int(
@@ -255,6 +470,67 @@ async def stats_command(ctx: SlashContext):
     await ctx.send(embed=embed, hidden=True)
 
 
+@slash.slash(
+    name='modstats',
+    description='See moderation activity over recent days',
+    guild_ids=[CONFIG.server.id],
+    options=[
+        create_option(
+            name='days',
+            description=f'How many days to include, up to {MAX_DAYS}',
+            option_type=SlashCommandOptionType.INTEGER,
+            required=False,
+        )
+    ],
+    permissions=Permissions.GLOBAL_MOD_ONLY.value,
+)
+@instrument('command')
+async def modstats_command(ctx: SlashContext, days: int = 30):
+    if not 1 <= days <= MAX_DAYS:
+        await ctx.send(f'Days must be between 1 and {MAX_DAYS}.', hidden=True)
+        return
+
+    await ctx.defer(hidden=True)
+
+    summary = await summarize(days)
+
+    embed = Embed(
+        title=f'Moderation over the last {days} days', color=Color.green()
+    )
+
+    embed.add_field(
+        name='Blocked', value=f'**`{sum(summary.blocks.values())}`** users'
+    )
+    embed.add_field(name='Reports', value=f'**`{summary.reports}`** reports')
+    embed.add_field(name='Reviewed', value=f'**`{summary.reviewed}`** reports')
+
+    top_reasons = '\n'.join(
+        f'{CONFIG.reason_titles.get(reason, reason)}: **`{count}`**'
+        for reason, count in summary.blocks.most_common(5)
+    )
+    embed.add_field(
+        name='Top block reasons', value=top_reasons or 'None', inline=False
+    )
+
+    actions = summary.moderator_blocks + summary.moderator_reviews
+    top_moderators = '\n'.join(
+        f'<@{moderator_id}>: **`{summary.moderator_blocks[moderator_id]}`** '
+        f'blocks, **`{summary.moderator_reviews[moderator_id]}`** reviews'
+        for moderator_id, _ in actions.most_common(5)
+    )
+    embed.add_field(
+        name='Top moderators', value=top_moderators or 'None', inline=False
+    )
+
+    latency_minutes = summary.average_review_latency / 60
+    embed.add_field(
+        name='Review time',
+        value=f'**`{latency_minutes:.1f}`** minutes on average',
+    )
+
+    await ctx.send(embed=embed, hidden=True)
+
+
 @slash.slash(
     name='eval',
     description='Evaluates a Python expression',
@@ -269,6 +545,7 @@ async def stats_command(ctx: SlashContext):
     guild_ids=[CONFIG.server.id],
     permissions=Permissions.DEVELOPER_ONLY.value,
 )
+@instrument('command')
 async def eval_command(ctx: SlashContext, expression: str):
     await ctx.defer(hidden=True)
 
@@ -318,11 +595,12 @@ async def eval_command(ctx: SlashContext, expression: str):
         ),
     ],
 )
+@instrument('command')
 async def report_command(ctx: SlashContext, user: Member, evidence: str):
     logger.debug(f'{ctx.author} reported {user} for {evidence}')
 
     if isinstance(user, int):
-        user = await client.fetch_user(user)
+        user = await USERS.resolve(client, user)
 
     await ctx.defer(hidden=True)
 
@@ -333,26 +611,18 @@ async def report_command(ctx: SlashContext, user: Member, evidence: str):
         await ctx.send(f'{user.mention} is immune to reporting.', hidden=True)
         return
 
-    # pylint: disable=no-member
-    if Report.objects(
-        user_id=user.id, reporter_id=ctx.author.id, reviewed=False
-    ):
+    if await has_open_report(user.id, reporter_id=ctx.author.id):
         await ctx.send(f"You've already reported {user.mention}.", hidden=True)
         return
 
     report = Report(
         reason=evidence, user_id=user.id, reporter_id=ctx.author.id
     )
-    report.save()
+    await save(report)
+    STATS.record_report()
+    MODLOG.record([report_event(report)])
 
-    await send_report_embed(
-        client,
-        reported=user,
-        reporter=ctx.author,
-        reason=evidence,
-        timestamp=report.timestamp.replace(tzinfo=timezone.utc),
-        report_id=str(report.id),
-    )
+    await REPORTS.submit(client, report)
 
     await ctx.send(
         f"{user.mention} has been reported for breaking Discord's rules.",
@@ -374,41 +644,31 @@ async def report_command(ctx: SlashContext, user: Member, evidence: str):
     ],
     permissions=Permissions.GLOBAL_MOD_ONLY.value,
 )
+@instrument('command')
 async def lookup_command(ctx: SlashContext, user: Member):
     logger.debug(f'Looking up {user}')
 
     if isinstance(user, int):
-        user = await client.fetch_user(user)
-
-    immune = user.id in CONFIG.immune
-
-    # pylint: disable=no-member
-    open_reports = bool(Report.objects(user_id=user.id, reviewed=False))
+        user = await USERS.resolve(client, user)
 
-    # pylint: disable=no-member
-    if Block.objects(user_id=user.id):
-        blocked = True
-        # pylint: disable=no-member
-        block = Block.objects.get(user_id=user.id)
-        reason = REASONS_DICT[block.reason]
-        block_timestamp = block.timestamp.replace(tzinfo=timezone.utc)
-        block_moderator = await client.fetch_user(block.moderator_id)
-    else:
-        blocked = False
+    [lookup] = await lookup_users([user.id])
+    block = lookup.block
 
-    embed = Embed(color=Color.gold() if immune else Color.blurple())
+    embed = Embed(color=Color.gold() if lookup.immune else Color.blurple())
     embed.set_author(name=str(user), icon_url=user.avatar_url)
 
     embed.add_field(
         name='Open reports',
-        value='Yes' if open_reports else 'No',
+        value='Yes' if lookup.open_reports else 'No',
         inline=False,
     )
-    embed.add_field(name='Blocked', value='Yes' if blocked else 'No')
+    embed.add_field(name='Blocked', value='Yes' if block else 'No')
 
-    if blocked:
+    if block:
+        reason = CONFIG.reason_titles[block.reason]
+        block_moderator = await USERS.resolve(client, block.moderator_id)
         timestamp = int(
-            block_timestamp.replace(tzinfo=timezone.utc).timestamp()
+            block.timestamp.replace(tzinfo=timezone.utc).timestamp()
         )
 
         embed.add_field(
@@ -421,6 +681,58 @@ async def lookup_command(ctx: SlashContext, user: Member):
     await ctx.send(embed=embed, hidden=True)
 
 
+@slash.slash(
+    name='lookupmany',
+    description='Finds global block information about several users',
+    guild_ids=[CONFIG.server.id, CONFIG.server.appeals_id],
+    options=[
+        create_option(
+            name='user_ids',
+            description='The space-separated user IDs to find',
+            option_type=SlashCommandOptionType.STRING,
+            required=True,
+        )
+    ],
+    permissions=Permissions.GLOBAL_MOD_ONLY.value,
+)
+@instrument('command')
+async def lookup_many_command(ctx: SlashContext, user_ids: str):
+    logger.debug(f'{ctx.author} looked up many users')
+
+    parsed = list(dict.fromkeys(user_ids.split()))
+    invalid = [user_id for user_id in parsed if not user_id.isdigit()]
+    valid = [int(user_id) for user_id in parsed if user_id.isdigit()]
+
+    if len(valid) > LOOKUP_LIMIT:
+        await ctx.send(
+            f'You can look up at most {LOOKUP_LIMIT} users at once.',
+            hidden=True,
+        )
+        return
+
+    await ctx.defer(hidden=True)
+
+    lookups = await lookup_users(valid)
+    moderators = await resolve_moderators(client, lookups)
+
+    lines = [format_lookup(lookup, moderators) for lookup in lookups]
+    lines += [f'`{user_id}` is not a valid ID' for user_id in invalid]
+    if not lines:
+        await ctx.send('No users to look up.', hidden=True)
+        return
+
+    blocked = sum(lookup.block is not None for lookup in lookups)
+    pages = list(chunk_lines(lines, EMBED_DESCRIPTION_LIMIT))
+    for i, page in enumerate(pages, 1):
+        embed = Embed(
+            title=f'{blocked} of {len(lookups)} users blocked',
+            description=page,
+            color=Color.blurple(),
+        )
+        embed.set_footer(text=f'Page {i}/{len(pages)}')
+        await ctx.send(embed=embed, hidden=True)
+
+
 @slash.slash(
     name='block',
     description='Block a user without a report',
@@ -437,19 +749,17 @@ async def lookup_command(ctx: SlashContext, user: Member):
             description='Reason for blocking',
             option_type=SlashCommandOptionType.STRING,
             required=True,
-            choices=[
-                create_choice(name=name, value=value)
-                for value, name in CONFIG.reasons
-            ],
+            choices=reason_choices(),
         ),
     ],
     permissions=Permissions.GLOBAL_MOD_ONLY.value,
 )
+@instrument('command')
 async def block_command(ctx: SlashContext, user: Member, reason: str):
     logger.debug(f'{ctx.author} blocked {user} for {reason}')
 
     if isinstance(user, int):
-        user = await client.fetch_user(user)
+        user = await USERS.resolve(client, user)
 
     await ctx.defer(hidden=True)
 
@@ -479,34 +789,43 @@ async def block_command(ctx: SlashContext, user: Member, reason: str):
             description='Reason for blocking',
             option_type=SlashCommandOptionType.STRING,
             required=True,
-            choices=[
-                create_choice(name=name, value=value)
-                for value, name in CONFIG.reasons
-            ],
+            choices=reason_choices(),
         ),
     ],
     permissions=Permissions.GLOBAL_MOD_ONLY.value,
 )
+@instrument('command')
 async def mass_block_command(ctx: SlashContext, user_ids: str, reason: str):
     logger.debug(f'{ctx.author} mass-blocked for {reason}')
 
     await ctx.defer(hidden=True)
 
-    users = [
-        await client.fetch_user(int(user_id))
-        for user_id in user_ids.split(' ')
-    ]
+    users, failed = await resolve_users(client, user_ids.split())
 
-    for user in users:
-        await create_block(
-            client,
-            user_id=user.id,
-            reason=reason,
-            moderator_id=ctx.author.id,
+    if failed:
+        await ctx.send(
+            f'Could not find {len(failed)} users: '
+            f'{", ".join(f"`{user_id}`" for user_id in failed)}',
+            hidden=True,
         )
 
+    if not users:
+        await ctx.send('No users to block.', hidden=True)
+        return
+
+    await ctx.send(
+        f'Blocking {len(users)} users across {len(client.guilds)} servers...',
+        hidden=True,
+    )
+
+    queued = await create_blocks(
+        client, users=users, reason=reason, moderator_id=ctx.author.id
+    )
+
     await ctx.send(
-        f'Blocked {", ".join(user.mention for user in users)}', hidden=True
+        f'Blocked {", ".join(user.mention for user in users)}\n'
+        f'Queued {queued} bans',
+        hidden=True,
     )
 
 
@@ -514,6 +833,7 @@ async def mass_block_command(ctx: SlashContext, user_ids: str, reason: str):
     target=ContextMenuType.MESSAGE,
     name='Report message',
 )
+@instrument('command')
 async def report_message(ctx: MenuContext):
     message: Message = ctx.target_message
     user: Member = message.author
@@ -530,15 +850,9 @@ async def report_message(ctx: MenuContext):
         await ctx.send(f'{user.mention} is immune to reporting.', hidden=True)
         return
 
-    # pylint: disable=no-member
-    if Report.objects(
-        user_id=user.id, reporter_id=ctx.author.id, reviewed=False
-    ):
+    if await has_open_report(user.id, reporter_id=ctx.author.id):
         await ctx.send(f"You've already reported {user.mention}.", hidden=True)
         return
-    elif Report.objects(message_id=message.id):
-        await ctx.send('This message has already been reported.', hidden=True)
-        return
 
     report = Report(
         reason=reason,
@@ -546,17 +860,18 @@ async def report_message(ctx: MenuContext):
         reporter_id=ctx.author.id,
         message_id=message.id,
     )
-    report.save()
 
-    await send_report_embed(
-        client,
-        reported=user,
-        reporter=ctx.author,
-        reason=reason,
-        timestamp=report.timestamp.replace(tzinfo=timezone.utc),
-        report_id=str(report.id),
-        message=True,
-    )
+    # The unique message_id index rejects a second report of a message
+    try:
+        await save(report)
+    except NotUniqueError:
+        await ctx.send('This message has already been reported.', hidden=True)
+        return
+
+    STATS.record_report()
+    MODLOG.record([report_event(report)])
+
+    await REPORTS.submit(client, report)
 
     await ctx.send(
         f"{user.mention} has been reported for breaking Discord's rules. Note "
@@ -567,4 +882,5 @@ async def report_message(ctx: MenuContext):
     )
 
 
-client.run(CONFIG.bot.token)
+if __name__ == '__main__':
+    client.run(CONFIG.bot.token)
@@ -0,0 +1,386 @@
+import logging
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+from aiohttp import web
+from discord import Client
+from discord.errors import HTTPException
+from loguru import logger
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _escape(value: str) -> str:
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+
+    pairs = ','.join(
+        f'{name}="{_escape(value)}"' for name, value in labels.items()
+    )
+    return f'{{{pairs}}}'
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+
+        return child
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [
+            (self.name, dict(zip(self.labelnames, key)), child.value)
+            for key, child in self._children.items()
+        ]
+
+    def render(self) -> str:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+        lines += [
+            f'{name}{_format_labels(labels)} {value}'
+            for name, labels, value in self.samples()
+        ]
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Histogram(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        bucket = f'{self.name}_bucket'
+
+        for key, child in self._children.items():
+            labels = dict(zip(self.labelnames, key))
+
+            bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+            cumulative = 0
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                samples.append((bucket, {**labels, 'le': bound}, cumulative))
+
+            samples.append((f'{self.name}_sum', labels, child.sum))
+            samples.append((f'{self.name}_count', labels, child.count))
+
+        return samples
+
+
+REGISTRY: List[Metric] = []
+
+HANDLER_SECONDS = Histogram(
+    'blockbot_handler_seconds',
+    'Time spent in event handlers and commands',
+    ('kind', 'name'),
+)
+HANDLER_ERRORS = Counter(
+    'blockbot_handler_errors_total',
+    'Exceptions raised by event handlers and commands',
+    ('kind', 'name'),
+)
+MONGO_SECONDS = Histogram(
+    'blockbot_mongo_command_seconds',
+    'Time spent in MongoDB commands',
+    ('command', 'status'),
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    'blockbot_mongo_pool_connections',
+    'Open MongoDB connections by server',
+    ('address',),
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    'blockbot_mongo_pool_checked_out',
+    'MongoDB connections in use by server',
+    ('address',),
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    'blockbot_mongo_pool_checkout_failures_total',
+    'MongoDB connection checkouts that failed, by reason',
+    ('address', 'reason'),
+)
+REST_REQUESTS = Counter(
+    'blockbot_discord_requests_total',
+    'Discord REST requests by route',
+    ('method', 'route'),
+)
+REST_ERRORS = Counter(
+    'blockbot_discord_errors_total',
+    'Discord REST requests that raised, by status',
+    ('method', 'route', 'status'),
+)
+RATE_LIMITS = Counter(
+    'blockbot_discord_rate_limits_total',
+    'Discord 429 responses handled by discord.py',
+    ('scope',),
+)
+OUTBOUND_QUEUE_DEPTH = Gauge(
+    'blockbot_outbound_queue_depth',
+    'Discord requests waiting for the outbound scheduler, by priority',
+    ('priority',),
+)
+BAN_QUEUE_DEPTH = Gauge(
+    'blockbot_ban_queue_depth', 'Ban jobs waiting or in progress'
+)
+BAN_QUEUE_THROUGHPUT = Gauge(
+    'blockbot_ban_queue_throughput',
+    'Ban jobs finished per second by this process over the last minute',
+)
+BAN_JOBS_ACTIVE = Gauge(
+    'blockbot_ban_jobs_active', 'Ban jobs being processed by this process'
+)
+BAN_OUTCOMES = Counter(
+    'blockbot_ban_outcomes_total', 'Finished ban jobs by outcome', ('outcome',)
+)
+BAN_TARGETS = Counter(
+    'blockbot_ban_targets_total', 'Guild and user pairs queued for banning'
+)
+
+
+def render() -> str:
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+def instrument(kind: str) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        histogram = HANDLER_SECONDS.labels(kind=kind, name=func.__name__)
+        errors = HANDLER_ERRORS.labels(kind=kind, name=func.__name__)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                histogram.observe(perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class CommandTimer(monitoring.CommandListener):
+    def started(self, event: monitoring.CommandStartedEvent):
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        MONGO_SECONDS.labels(command=event.command_name, status='ok').observe(
+            event.duration_micros / 1e6
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        MONGO_SECONDS.labels(
+            command=event.command_name, status='error'
+        ).observe(event.duration_micros / 1e6)
+
+
+def _address(
+    event: Union[monitoring._PoolEvent, monitoring._ConnectionEvent]
+) -> str:
+    host, port = event.address
+    return f'{host}:{port}'
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    def pool_created(self, event: monitoring.PoolCreatedEvent):
+        pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent):
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent):
+        address = _address(event)
+        logger.warning(f'MongoDB pool for {address} was cleared')
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent):
+        pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent):
+        MONGO_POOL_CONNECTIONS.labels(address=_address(event)).inc()
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent):
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent):
+        MONGO_POOL_CONNECTIONS.labels(address=_address(event)).dec()
+
+    def connection_check_out_started(
+        self, event: monitoring.ConnectionCheckOutStartedEvent
+    ):
+        pass
+
+    def connection_check_out_failed(
+        self, event: monitoring.ConnectionCheckOutFailedEvent
+    ):
+        address = _address(event)
+        MONGO_POOL_CHECKOUT_FAILURES.labels(
+            address=address, reason=event.reason
+        ).inc()
+        logger.warning(
+            f'MongoDB connection checkout from {address} failed: '
+            f'{event.reason}'
+        )
+
+    def connection_checked_out(
+        self, event: monitoring.ConnectionCheckedOutEvent
+    ):
+        MONGO_POOL_CHECKED_OUT.labels(address=_address(event)).inc()
+
+    def connection_checked_in(
+        self, event: monitoring.ConnectionCheckedInEvent
+    ):
+        MONGO_POOL_CHECKED_OUT.labels(address=_address(event)).dec()
+
+
+class _RateLimitFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.msg.startswith('We are being rate limited'):
+            RATE_LIMITS.labels(scope='route').inc()
+        elif record.msg.startswith('Global rate limit has been hit'):
+            RATE_LIMITS.labels(scope='global').inc()
+
+        return True
+
+
+def instrument_client(client: Client):
+    request = client.http.request
+
+    @wraps(request)
+    async def instrumented_request(route, **kwargs):
+        REST_REQUESTS.labels(method=route.method, route=route.path).inc()
+        try:
+            return await request(route, **kwargs)
+        except HTTPException as exc:
+            REST_ERRORS.labels(
+                method=route.method, route=route.path, status=exc.status
+            ).inc()
+            raise
+
+    client.http.request = instrumented_request
+
+    # discord.py only reports the 429s it retries through its logger
+    logging.getLogger('discord.http').addFilter(_RateLimitFilter())
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        text=render(), content_type='text/plain', charset='utf-8'
+    )
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    return runner
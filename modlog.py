@@ -0,0 +1,178 @@
+import asyncio
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from loguru import logger
+
+from database import (
+    Report,
+    ReportCard,
+    find_moderation_rollups,
+    record_moderation_events,
+)
+
+# Rollups are kept per UTC day, so this is also the most rollups one
+# summary reads
+MAX_DAYS = 366
+
+# Events are written in batches at most this often, so moderation commands
+# don't wait on the extra writes
+FLUSH_INTERVAL = 1
+
+
+class ModerationSummary(NamedTuple):
+    days: int
+    blocks: Counter
+    moderator_blocks: Counter
+    moderator_reviews: Counter
+    reports: int
+    reviewed: int
+    review_seconds: float
+
+    @property
+    def average_review_latency(self) -> float:
+        if not self.reviewed:
+            return 0.0
+
+        return self.review_seconds / self.reviewed
+
+
+def _day(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def block_event(
+    *, user_id: int, reason: str, moderator_id: int, timestamp: datetime
+) -> Dict:
+    return {
+        'type': 'block',
+        'timestamp': timestamp,
+        'user_id': user_id,
+        'reason': reason,
+        'moderator_id': moderator_id,
+    }
+
+
+def report_event(report: Report) -> Dict:
+    return {
+        'type': 'report',
+        'timestamp': report.timestamp,
+        'user_id': report.user_id,
+        'reporter_id': report.reporter_id,
+        'report_id': report.id,
+        'message_id': report.message_id,
+    }
+
+
+def review_event(
+    card: ReportCard,
+    *,
+    moderator_id: int,
+    reviewed_at: datetime,
+    seconds: float,
+    count: int,
+) -> Dict:
+    return {
+        'type': 'review',
+        'timestamp': reviewed_at,
+        'user_id': card.user_id,
+        'card_id': card.id,
+        'moderator_id': moderator_id,
+        'reports': count,
+        'seconds': seconds,
+    }
+
+
+def _rollup(event: Dict) -> Dict[str, float]:
+    if event['type'] == 'block':
+        return {
+            f'blocks.{event["reason"]}': 1,
+            f'moderators.{event["moderator_id"]}.blocks': 1,
+        }
+    if event['type'] == 'report':
+        return {'reports': 1}
+
+    return {
+        'reviewed': event['reports'],
+        'review_seconds': event['seconds'],
+        f'moderators.{event["moderator_id"]}.reviews': event['reports'],
+    }
+
+
+class ModerationLog:
+    def __init__(self):
+        self._pending: List[Dict] = []
+        self._flush: Optional[asyncio.Task] = None
+
+    def record(self, events: Iterable[Dict]):
+        self._pending.extend(events)
+
+        if self._pending and self._flush is None:
+            self._flush = asyncio.ensure_future(self._flush_later())
+
+    async def stop(self):
+        if self._flush is not None:
+            self._flush.cancel()
+            self._flush = None
+
+        await self.flush()
+
+    async def _flush_later(self):
+        await asyncio.sleep(FLUSH_INTERVAL)
+        self._flush = None
+        await self.flush()
+
+    async def flush(self):
+        events, self._pending = self._pending, []
+        if not events:
+            return
+
+        by_day = defaultdict(list)
+        rollups = defaultdict(Counter)
+        for event in events:
+            day = _day(event['timestamp'])
+            by_day[day].append(event)
+            rollups[day].update(_rollup(event))
+
+        # The actions themselves have already happened, so a failed write
+        # only costs their history
+        try:
+            await record_moderation_events(
+                by_day, {day: dict(counts) for day, counts in rollups.items()}
+            )
+        except Exception:
+            logger.exception(f'Failed to record {len(events)} events')
+
+
+async def summarize(days: int) -> ModerationSummary:
+    since = _day(datetime.utcnow()) - timedelta(days=days - 1)
+
+    blocks = Counter()
+    moderator_blocks = Counter()
+    moderator_reviews = Counter()
+    reports = reviewed = 0
+    review_seconds = 0.0
+
+    # One document per day however many events there were
+    for rollup in await find_moderation_rollups(since):
+        blocks.update(rollup.blocks)
+        for moderator_id, counts in rollup.moderators.items():
+            moderator_blocks[int(moderator_id)] += counts.get('blocks', 0)
+            moderator_reviews[int(moderator_id)] += counts.get('reviews', 0)
+        reports += rollup.reports
+        reviewed += rollup.reviewed
+        review_seconds += rollup.review_seconds
+
+    return ModerationSummary(
+        days,
+        blocks,
+        +moderator_blocks,
+        +moderator_reviews,
+        reports,
+        reviewed,
+        review_seconds,
+    )
+
+
+MODLOG = ModerationLog()
@@ -0,0 +1,243 @@
+import asyncio
+from collections import defaultdict
+from enum import Enum
+from typing import Collection, Dict, Iterable, List, Optional, Set, Tuple
+
+from discord import Client, Embed, Guild, Member, User
+from discord.errors import Forbidden, HTTPException, NotFound
+from discord.http import Route
+from loguru import logger
+
+from config import CONFIG
+from database import Block, get_block
+from ratelimit import SCHEDULER, Backpressure, Priority
+from users import USERS
+
+
+class BanOutcome(Enum):
+    BANNED = 'banned'
+    NOT_MEMBER = 'not a member'
+    FORBIDDEN = 'forbidden'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+
+
+# Gateway member requests accept at most this many user IDs each
+QUERY_MEMBERS_LIMIT = 100
+
+# The bulk ban endpoint accepts at most this many user IDs each
+BULK_BAN_LIMIT = 200
+
+# Held so pending ban DMs aren't garbage collected before they run
+_notifications: Set[asyncio.Task] = set()
+
+
+async def find_member(guild: Guild, user_id: int) -> Optional[Member]:
+    member = guild.get_member(user_id)
+
+    # A chunked guild's cache is complete, so a miss means not a member
+    if member is not None or guild.chunked:
+        return member
+
+    try:
+        async with SCHEDULER.slot(Priority.BAN):
+            return await guild.fetch_member(user_id)
+    except NotFound:
+        return None
+
+
+async def find_members(
+    guild: Guild, user_ids: Collection[int]
+) -> List[Member]:
+    members = []
+    missing = []
+
+    for user_id in user_ids:
+        member = guild.get_member(user_id)
+        if member is not None:
+            members.append(member)
+        elif not guild.chunked:
+            missing.append(user_id)
+
+    for i in range(0, len(missing), QUERY_MEMBERS_LIMIT):
+        chunk = missing[i : i + QUERY_MEMBERS_LIMIT]
+        members += await guild.query_members(
+            user_ids=chunk, limit=len(chunk), cache=False
+        )
+
+    return members
+
+
+async def ban_reason(client: Client, block: Block) -> str:
+    moderator = await USERS.resolve(
+        client, block.moderator_id, priority=Priority.BAN
+    )
+    return (
+        f'Global block by {moderator} ({moderator.id})\n\n'
+        f'{CONFIG.reason_titles[block.reason]}'
+    )
+
+
+async def ban_user(
+    client: Client, guild: Guild, user: Member, block: Block = None
+):
+    if block is None:
+        block = await get_block(user.id)
+
+    reason = await ban_reason(client, block)
+
+    logger.debug(f'Banning {user} from {guild}')
+
+    async with SCHEDULER.slot(Priority.BAN, ('ban', guild.id)):
+        await guild.ban(user, reason=reason)
+
+    notify_later(guild, user, block)
+
+
+async def ban_members(
+    client: Client,
+    guild: Guild,
+    members: List[Member],
+    blocks: Dict[int, Block],
+) -> List[Member]:
+    # Members blocked by the same moderator for the same reason share an
+    # audit log reason, so they can share a request
+    groups: Dict[Tuple[int, str], List[Member]] = defaultdict(list)
+    for member in members:
+        block = blocks[member.id]
+        groups[block.moderator_id, block.reason].append(member)
+
+    banned = []
+    for group in groups.values():
+        reason = await ban_reason(client, blocks[group[0].id])
+        for i in range(0, len(group), BULK_BAN_LIMIT):
+            banned += await bulk_ban(
+                client, guild, group[i : i + BULK_BAN_LIMIT], reason
+            )
+
+    return banned
+
+
+async def bulk_ban(
+    client: Client, guild: Guild, members: List[Member], reason: str
+) -> List[Member]:
+    logger.debug(f'Bulk banning {len(members)} members from {guild}')
+
+    # discord.py doesn't wrap this endpoint, and it also needs the Manage
+    # Server permission, so fall back to banning one by one
+    route = Route('POST', '/guilds/{guild_id}/bulk-ban', guild_id=guild.id)
+    try:
+        async with SCHEDULER.slot(Priority.BAN, ('ban', guild.id)):
+            data = await client.http.request(
+                route,
+                json={'user_ids': [str(member.id) for member in members]},
+                reason=reason,
+            )
+    except (Forbidden, NotFound):
+        return await ban_each(guild, members, reason)
+
+    banned_ids = {int(user_id) for user_id in data['banned_users']}
+    return [member for member in members if member.id in banned_ids]
+
+
+async def ban_each(
+    guild: Guild, members: List[Member], reason: str
+) -> List[Member]:
+    async def ban(member: Member):
+        async with SCHEDULER.slot(Priority.BAN, ('ban', guild.id)):
+            await guild.ban(member, reason=reason)
+
+    results = await asyncio.gather(
+        *(ban(member) for member in members), return_exceptions=True
+    )
+
+    banned = []
+    for member, result in zip(members, results):
+        if isinstance(result, Forbidden):
+            logger.warning(f'Missing permissions to ban {member} in {guild}')
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            banned.append(member)
+
+    return banned
+
+
+async def notify_banned_user(guild: Guild, user: User, block: Block):
+    embed = Embed(
+        title=f'Banned from {guild.name}',
+        description='You were banned from this server due to your global block'
+        " for violating Discord's rules.",
+    )
+    embed.add_field(name='Reason', value=CONFIG.reason_titles[block.reason])
+    embed.add_field(
+        name='Appeal',
+        value=f'https://discord.gg/{CONFIG.server.appeals_invite}',
+    )
+
+    embed.set_footer(text=f'User ID: {user.id}')
+
+    try:
+        async with SCHEDULER.slot(Priority.DM):
+            await user.send(embed=embed)
+    except (HTTPException, Backpressure):
+        logger.warning(f'Failed to send message to {user}')
+
+
+def notify_later(guild: Guild, user: User, block: Block):
+    # DMs are served last, so a ban never waits on one. Under backpressure
+    # the DM is dropped.
+    task = asyncio.ensure_future(notify_banned_user(guild, user, block))
+    _notifications.add(task)
+    task.add_done_callback(_notifications.discard)
+
+
+def is_retryable(exc: HTTPException) -> bool:
+    return exc.status == 429 or exc.status >= 500
+
+
+async def ban_in_guild(
+    client: Client, guild: Guild, block: Block
+) -> BanOutcome:
+    if guild.id in CONFIG.noban_servers:
+        return BanOutcome.SKIPPED
+
+    member = await find_member(guild, block.user_id)
+    if member is None:
+        return BanOutcome.NOT_MEMBER
+
+    try:
+        await ban_user(client, guild, member, block)
+    except Forbidden:
+        return BanOutcome.FORBIDDEN
+
+    return BanOutcome.BANNED
+
+
+async def find_targets(
+    client: Client, user_ids: Collection[int], guilds: Iterable[Guild] = None
+) -> List[Tuple[int, int]]:
+    if guilds is None:
+        guilds = client.guilds
+
+    semaphore = asyncio.Semaphore(CONFIG.propagation.concurrency)
+    targets = []
+
+    async def sweep(guild: Guild):
+        if guild.id in CONFIG.noban_servers:
+            return
+
+        async with semaphore:
+            try:
+                members = await find_members(guild, user_ids)
+            except asyncio.TimeoutError:
+                # The ban jobs fall back to looking each user up over REST
+                logger.warning(f'Timed out looking up members of {guild}')
+                targets.extend((guild.id, user_id) for user_id in user_ids)
+                return
+
+        targets.extend((guild.id, member.id) for member in members)
+
+    await asyncio.gather(*(sweep(guild) for guild in guilds))
+
+    return targets
@@ -0,0 +1,176 @@
+import asyncio
+from collections import deque
+from enum import IntEnum
+from time import monotonic
+from typing import Deque, Dict, Hashable, Optional, Tuple
+
+from config import CONFIG
+
+
+class Priority(IntEnum):
+    BAN = 0
+    REPORT = 1
+    LOG = 2
+    DM = 3
+
+
+class Backpressure(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate: float, per: float = 1.0):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = monotonic()
+
+    def refill(self, now: float):
+        refill = (now - self.updated) * self.rate / self.per
+        self.tokens = min(self.rate, self.tokens + refill)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        return max(0.0, (1 - self.tokens) * self.per / self.rate)
+
+
+class _Slot:
+    def __init__(
+        self,
+        scheduler: 'OutboundScheduler',
+        priority: Priority,
+        bucket: Optional[Hashable],
+    ):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.bucket = bucket
+
+    async def __aenter__(self):
+        await self.scheduler.acquire(self.priority, self.bucket)
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class OutboundScheduler:
+    def __init__(
+        self,
+        rate: float,
+        *,
+        bucket_rate: float,
+        bucket_per: float,
+        backlog: Dict[Priority, int],
+    ):
+        self.bucket_rate = bucket_rate
+        self.bucket_per = bucket_per
+        self.backlog = backlog
+        self._global = TokenBucket(rate)
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._queues: Dict[
+            Priority, Deque[Tuple[Optional[Hashable], asyncio.Future]]
+        ] = {priority: deque() for priority in Priority}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def depth(self, priority: Priority) -> int:
+        return len(self._queues[priority])
+
+    def slot(self, priority: Priority, bucket: Hashable = None) -> _Slot:
+        return _Slot(self, priority, bucket)
+
+    async def acquire(self, priority: Priority, bucket: Hashable = None):
+        queue = self._queues[priority]
+
+        # Cosmetic classes are bounded so a flood sheds them instead of
+        # delaying everything queued behind them
+        limit = self.backlog.get(priority)
+        if limit is not None and len(queue) >= limit:
+            raise Backpressure(f'{priority.name} backlog is full')
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append((bucket, future))
+        self._start()
+        self._wakeup.set()
+
+        await future
+
+    def _start(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def _bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.bucket_rate, self.bucket_per)
+            self._buckets[key] = bucket
+
+        return bucket
+
+    def _grant(self, now: float) -> Optional[float]:
+        # Returns how long to wait before a waiter could be granted, or
+        # None if nothing is waiting
+        self._global.refill(now)
+        if self._global.tokens < 1:
+            return self._global.wait_time()
+
+        waits = []
+        for queue in self._queues.values():
+            for entry in list(queue):
+                key, future = entry
+                if future.done():
+                    queue.remove(entry)
+                    continue
+
+                bucket = None
+                if key is not None:
+                    bucket = self._bucket(key)
+                    bucket.refill(now)
+                    if bucket.tokens < 1:
+                        waits.append(bucket.wait_time())
+                        continue
+
+                queue.remove(entry)
+                self._global.tokens -= 1
+                if bucket is not None:
+                    bucket.tokens -= 1
+                future.set_result(None)
+                return 0.0
+
+        return min(waits) if waits else None
+
+    def _prune(self, now: float):
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.rate:
+                del self._buckets[key]
+
+    async def _dispatch(self):
+        while True:
+            now = monotonic()
+            wait = self._grant(now)
+            if wait == 0.0:
+                continue
+
+            if wait is None:
+                self._prune(now)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+
+# discord.py already queues requests per route bucket and retries 429s, but
+# only after Discord rejects them. Pacing requests ourselves keeps floods
+# under the global limit and lets bans jump ahead of messages.
+SCHEDULER = OutboundScheduler(
+    CONFIG.scheduler.rate,
+    bucket_rate=CONFIG.scheduler.bucket_rate,
+    bucket_per=CONFIG.scheduler.bucket_per,
+    backlog={
+        Priority.LOG: CONFIG.scheduler.log_backlog,
+        Priority.DM: CONFIG.scheduler.dm_backlog,
+    },
+)
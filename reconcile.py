@@ -0,0 +1,215 @@
+import asyncio
+from datetime import datetime, timedelta
+from heapq import nsmallest
+from math import ceil
+from time import monotonic
+from typing import AsyncIterator, Collection, List, Optional, Set, Tuple
+
+from discord import Client, Guild, Member, Object
+from loguru import logger
+
+from blocklist import BLOCKLIST
+from config import CONFIG
+from database import (
+    ReconcileCursor,
+    find_blocked,
+    find_reconcile_cursors,
+    save,
+)
+
+# Caps how many guilds are scanned at once so a burst of large guild joins
+# can't monopolise the event loop or the member endpoints.
+_semaphore = asyncio.Semaphore(CONFIG.reconcile.concurrency)
+
+# Past this many new blocks at once, one pass over each guild's members is
+# cheaper than looking every blocked user up in every guild
+SWEEP_THRESHOLD = 100
+
+
+async def iter_members(guild: Guild) -> AsyncIterator[Member]:
+    if guild.chunked:
+        for member in guild.members:
+            yield member
+    else:
+        async for member in guild.fetch_members(limit=None):
+            yield member
+
+
+async def match_blocked(user_ids: List[int]) -> List[int]:
+    if BLOCKLIST.loaded:
+        return [user_id for user_id in user_ids if user_id in BLOCKLIST]
+
+    return list(await find_blocked(user_ids))
+
+
+async def enqueue_blocked(
+    client: Client,
+    guild: Guild,
+    user_ids: List[int],
+    among: Optional[Set[int]] = None,
+) -> int:
+    if among is None:
+        blocked = await match_blocked(user_ids)
+    else:
+        blocked = [user_id for user_id in user_ids if user_id in among]
+
+    return await client.ban_queue.enqueue(
+        (guild.id, user_id) for user_id in blocked
+    )
+
+
+async def reconcile_guild(
+    client: Client, guild: Guild, among: Optional[Set[int]] = None
+) -> int:
+    if guild.id in CONFIG.noban_servers:
+        return 0
+
+    async with _semaphore:
+        started = monotonic()
+        scanned = 0
+        matched = 0
+        chunk = []
+
+        async def flush():
+            nonlocal matched
+            matched += await enqueue_blocked(client, guild, chunk, among)
+            chunk.clear()
+
+            # Let other events run between chunks of a large guild
+            await asyncio.sleep(0)
+
+        async for member in iter_members(guild):
+            chunk.append(member.id)
+            scanned += 1
+
+            if len(chunk) >= CONFIG.reconcile.chunk_size:
+                await flush()
+
+        if chunk:
+            await flush()
+
+    # Sweeps for new blocks touch every guild, so only full passes log
+    log = logger.info if among is None else logger.debug
+    log(
+        f'Reconciled {guild}: {matched} blocked of {scanned} members in '
+        f'{monotonic() - started:.2f}s'
+    )
+
+    return matched
+
+
+async def sweep_guilds(client: Client, user_ids: Collection[int]) -> int:
+    among = set(user_ids)
+    results = await asyncio.gather(
+        *(reconcile_guild(client, guild, among) for guild in client.guilds)
+    )
+    return sum(results)
+
+
+async def fetch_member_page(guild: Guild, after: int, limit: int) -> List[int]:
+    # Pages follow member IDs so a pass can resume where it stopped
+    if guild.chunked:
+        return nsmallest(
+            limit, (member.id for member in guild.members if member.id > after)
+        )
+
+    member_ids = []
+    async for member in guild.fetch_members(limit=limit, after=Object(after)):
+        member_ids.append(member.id)
+        if len(member_ids) >= limit:
+            break
+
+    return member_ids
+
+
+class DriftReconciler:
+    # Bans can go missing while the bot is offline, rate limited or lacking
+    # permissions, so every guild is rescanned once per drift period. Each
+    # tick scans its share of all members, resuming unfinished guilds from
+    # their cursor, which keeps the load flat across the period.
+    def __init__(self, client: Client):
+        self.client = client
+
+    async def run(self) -> int:
+        guilds = [
+            guild
+            for guild in self.client.guilds
+            if guild.id not in CONFIG.noban_servers
+        ]
+        if not guilds:
+            return 0
+
+        settings = CONFIG.reconcile
+        budget = ceil(
+            sum(guild.member_count or 0 for guild in guilds)
+            * settings.drift_interval
+            / settings.drift_period
+        )
+        due = datetime.utcnow() - timedelta(seconds=settings.drift_period)
+        cursors = await find_reconcile_cursors([guild.id for guild in guilds])
+
+        # Unfinished passes first, then the longest since reconciled
+        def order(guild: Guild) -> Tuple[bool, datetime]:
+            cursor = cursors.get(guild.id)
+            if cursor is None:
+                return True, datetime.min
+
+            reconciled_at = cursor.reconciled_at or datetime.min
+            return not cursor.member_after, reconciled_at
+
+        matched = 0
+        for guild in sorted(guilds, key=order):
+            cursor = cursors.get(guild.id)
+            if cursor is None:
+                cursor = ReconcileCursor(guild_id=guild.id)
+
+            # Guilds come oldest first, so the rest aren't due either
+            if not cursor.member_after and (cursor.reconciled_at or due) > due:
+                break
+            if budget <= 0:
+                break
+
+            scanned, found = await self._scan(guild, cursor, budget)
+            budget -= scanned
+            matched += found
+
+        if matched:
+            logger.info(f'Queued {matched} bans missing from guilds')
+
+        return matched
+
+    async def _scan(
+        self, guild: Guild, cursor: ReconcileCursor, budget: int
+    ) -> Tuple[int, int]:
+        scanned = 0
+        matched = 0
+
+        # Bans would only fail, so leave the guild until the next period
+        if guild.me.guild_permissions.ban_members:
+            async with _semaphore:
+                while scanned < budget:
+                    limit = min(CONFIG.reconcile.chunk_size, budget - scanned)
+                    page = await fetch_member_page(
+                        guild, cursor.member_after, limit
+                    )
+                    if page:
+                        matched += await enqueue_blocked(
+                            self.client, guild, page
+                        )
+                        scanned += len(page)
+                        cursor.member_after = max(page)
+
+                    if len(page) < limit:
+                        break
+
+                    await save(cursor)
+                else:
+                    return scanned, matched
+
+        cursor.member_after = 0
+        cursor.reconciled_at = datetime.utcnow()
+        await save(cursor)
+
+        logger.debug(f'Reconciled bans in {guild}: {matched} missing')
+
+        return scanned, matched
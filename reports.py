@@ -0,0 +1,291 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from time import monotonic
+from typing import Dict, List, Optional, Set
+
+from bson import ObjectId
+from discord import Client, Color, Embed
+from discord.errors import Forbidden, HTTPException
+from loguru import logger
+
+from config import CONFIG
+from database import (
+    Report,
+    ReportCard,
+    adopt_legacy_report,
+    adopt_reports,
+    attach_report,
+    claim_card,
+    discard_card,
+    find_card_reporters,
+    find_card_reports,
+    find_open_card,
+    get_card,
+    release_card,
+    resolve_reports,
+    save,
+)
+from modlog import MODLOG, review_event
+from ratelimit import SCHEDULER, Backpressure, Priority
+from stats import STATS
+from users import USERS
+from utils import chunk_lines, format_user_info, make_report_actionrows
+
+EMBED_FIELD_LIMIT = 1024
+EVIDENCE_LENGTH = 150
+
+# Interaction tokens expire after 15 minutes, and redeliveries with them
+INTERACTION_TTL = 15 * 60
+
+
+def format_evidence(report: Report) -> str:
+    evidence = report.reason
+    if len(evidence) > EVIDENCE_LENGTH:
+        evidence = evidence[: EVIDENCE_LENGTH - 3] + '...'
+
+    source = ' (message)' if report.message_id else ''
+    return f'<@{report.reporter_id}>{source}: {evidence}'
+
+
+class ReportCards:
+    def __init__(self):
+        self._opening: Dict[int, asyncio.Task] = {}
+        self._edits: Dict[ObjectId, asyncio.Task] = {}
+        self._asks: Set[asyncio.Task] = set()
+        self._interactions: 'OrderedDict[str, float]' = OrderedDict()
+
+    def first_delivery(self, interaction_id: str) -> bool:
+        now = monotonic()
+        while self._interactions:
+            oldest, expires = next(iter(self._interactions.items()))
+            if expires > now:
+                break
+            del self._interactions[oldest]
+
+        if interaction_id in self._interactions:
+            return False
+
+        self._interactions[interaction_id] = now + INTERACTION_TTL
+        return True
+
+    async def submit(self, client: Client, report: Report) -> ReportCard:
+        # Reports arriving while a card is being opened attach to it rather
+        # than opening their own
+        task = self._opening.get(report.user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._open(client, report))
+            self._opening[report.user_id] = task
+            task.add_done_callback(lambda _: self._opening.pop(report.user_id))
+
+        card = await asyncio.shield(task)
+
+        if report.card is None:
+            if not await attach_report(card, report):
+                # The card was closed since it was looked up
+                return await self.submit(client, report)
+
+            self._schedule_edit(client, card)
+
+        return card
+
+    async def review(self, card: ReportCard, moderator_id: int) -> int:
+        reviewed_at = datetime.utcnow()
+        seconds, count = await resolve_reports(card, reviewed_at)
+        STATS.record_reviews(seconds, count)
+
+        if count:
+            MODLOG.record(
+                [
+                    review_event(
+                        card,
+                        moderator_id=moderator_id,
+                        reviewed_at=reviewed_at,
+                        seconds=seconds,
+                        count=count,
+                    )
+                ]
+            )
+
+        return count
+
+    async def claim(
+        self, card_id: str, flag: str, channel_id: int, message_id: int
+    ) -> Optional[ReportCard]:
+        card = await claim_card(card_id, flag)
+
+        # Report messages posted before cards existed carry a report's ID.
+        # Its open reports are moved onto a card, which is claimed instead.
+        if card is None:
+            legacy_id = await adopt_legacy_report(
+                card_id, channel_id, message_id
+            )
+            if legacy_id is not None:
+                card = await claim_card(legacy_id, flag)
+
+        if card is not None and card.closed:
+            edit = self._edits.pop(card.id, None)
+            if edit is not None:
+                edit.cancel()
+
+        return card
+
+    async def release(self, card: ReportCard, flag: str):
+        await release_card(card.id, flag)
+
+    async def find_reporters(self, card: ReportCard) -> List[int]:
+        return await find_card_reporters(card)
+
+    def ask_for_info(
+        self, client: Client, card: ReportCard, reporter_ids: List[int]
+    ):
+        # A coalesced card can have hundreds of reporters, far more DMs
+        # than fit in the interaction's response deadline
+        task = asyncio.ensure_future(
+            self._ask_reporters(client, card, reporter_ids)
+        )
+        self._asks.add(task)
+        task.add_done_callback(self._asks.discard)
+
+    async def _ask_reporters(
+        self, client: Client, card: ReportCard, reporter_ids: List[int]
+    ):
+        results = await asyncio.gather(
+            *(
+                self._ask_reporter(client, card, reporter_id)
+                for reporter_id in reporter_ids
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.opt(exception=result).error(
+                    f'Failed to ask a reporter on report card {card.id}'
+                )
+
+        asked = sum(result is True for result in results)
+        logger.info(
+            f'Asked {asked}/{len(reporter_ids)} reporters for more info on '
+            f'report card {card.id}'
+        )
+
+    async def _ask_reporter(
+        self, client: Client, card: ReportCard, reporter_id: int
+    ) -> bool:
+        user = await USERS.resolve(client, reporter_id)
+
+        embed = Embed(
+            title='Please provide us with more information',
+            description=f"Hey, {user.mention}! We've reviewed your report and "
+            'think we need a little more information or evidence.',
+        )
+        embed.add_field(
+            name='Next steps',
+            value='Please join our mail server at '
+            f'https://discord.gg/{CONFIG.server.appeals_invite} and create a '
+            'ticket to provide us more info. Thank you!',
+        )
+        embed.set_footer(text=f'Report ID: {card.id}')
+
+        try:
+            async with SCHEDULER.slot(Priority.DM):
+                await user.send(embed=embed)
+        except (Forbidden, Backpressure):
+            return False
+
+        return True
+
+    async def _open(self, client: Client, report: Report) -> ReportCard:
+        since = datetime.utcnow() - timedelta(seconds=CONFIG.reports.window)
+        card = await find_open_card(report.user_id, since)
+        if card is not None:
+            return card
+
+        channel = client.get_channel(CONFIG.server.channels.reports)
+
+        card = ReportCard(
+            id=ObjectId(), user_id=report.user_id, channel_id=channel.id
+        )
+        report.card = card
+        await save(report)
+
+        # Reports left without a card when posting one failed join this one
+        card.reports = 1 + await adopt_reports(card)
+        await save(card)
+
+        try:
+            async with SCHEDULER.slot(Priority.REPORT, channel.id):
+                message = await channel.send(
+                    '@here',
+                    embed=await self._render(client, card),
+                    components=make_report_actionrows(str(card.id)),
+                )
+        except Exception:
+            # Moderators would never see reports attached to a card without
+            # a message, so they wait for the next card instead
+            report.card = None
+            await discard_card(card)
+            raise
+
+        card.message_id = message.id
+        await save(card)
+
+        return card
+
+    def _schedule_edit(self, client: Client, card: ReportCard):
+        # Reports landing within the delay share a single edit
+        if card.id not in self._edits:
+            self._edits[card.id] = asyncio.ensure_future(
+                self._edit(client, card.id)
+            )
+
+    async def _edit(self, client: Client, card_id: ObjectId):
+        await asyncio.sleep(CONFIG.reports.edit_delay)
+        del self._edits[card_id]
+
+        try:
+            card = await get_card(card_id)
+            if card.closed or card.message_id is None:
+                return
+
+            channel = client.get_channel(card.channel_id)
+            message = channel.get_partial_message(card.message_id)
+            embed = await self._render(client, card)
+
+            # Leaving components out keeps the existing action rows
+            async with SCHEDULER.slot(Priority.REPORT, channel.id):
+                await message.edit(embed=embed)
+        except HTTPException:
+            logger.warning(f'Failed to update report card {card_id}')
+        except Exception:
+            logger.exception(f'Failed to update report card {card_id}')
+
+    async def _render(self, client: Client, card: ReportCard) -> Embed:
+        reported = await USERS.resolve(client, card.user_id)
+        reports = await find_card_reports(card, CONFIG.reports.samples)
+        single = card.reports == 1
+
+        embed = Embed(
+            title='New report' if single else f'{card.reports} reports',
+            color=Color.gold(),
+            timestamp=card.opened_at.replace(tzinfo=timezone.utc),
+        )
+        embed.add_field(
+            name='Reported', value=format_user_info(reported), inline=False
+        )
+        embed.add_field(
+            name='Reporters', value=f'**`{card.reports}`**', inline=False
+        )
+        embed.add_field(
+            name='Evidence' if single else 'Latest evidence',
+            value=next(
+                chunk_lines(map(format_evidence, reports), EMBED_FIELD_LIMIT)
+            ),
+            inline=False,
+        )
+        embed.set_footer(text=str(card.id))
+
+        return embed
+
+
+REPORTS = ReportCards()
@@ -0,0 +1,70 @@
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+from discord import Guild
+
+from database import (
+    count_blocks,
+    count_blocks_by_reason,
+    count_reports,
+    sum_review_latency,
+)
+
+
+def count_lines_of_code() -> int:
+    return sum(
+        sum(line.strip() != '' for line in source_path.open())
+        for source_path in Path(__file__).parent.glob('*.py')
+    )
+
+
+class Stats:
+    def __init__(self):
+        self.lines_of_code = count_lines_of_code()
+        self.guilds = 0
+        self.members = 0
+        self.blocks = 0
+        self.blocks_by_reason = Counter()
+        self.reports = 0
+        self._review_seconds = 0.0
+        self._reviewed = 0
+
+    @property
+    def average_review_latency(self) -> float:
+        if not self._reviewed:
+            return 0.0
+
+        return self._review_seconds / self._reviewed
+
+    def record_block(self, reason: str, count: int = 1):
+        self.blocks += count
+        self.blocks_by_reason[reason] += count
+
+    def record_report(self):
+        self.reports += 1
+
+    def record_reviews(self, seconds: float, count: int):
+        self._review_seconds += seconds
+        self._reviewed += count
+
+    def record_guild_join(self, guild: Guild):
+        self.guilds += 1
+        self.members += guild.member_count
+
+    def record_guild_remove(self, guild: Guild):
+        self.guilds -= 1
+        self.members -= guild.member_count
+
+    async def reconcile(self, guilds: Iterable[Guild]):
+        guilds = list(guilds)
+        self.guilds = len(guilds)
+        self.members = sum(guild.member_count for guild in guilds)
+
+        self.blocks = await count_blocks()
+        self.blocks_by_reason = Counter(await count_blocks_by_reason())
+        self.reports = await count_reports()
+        self._review_seconds, self._reviewed = await sum_review_latency()
+
+
+STATS = Stats()
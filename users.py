@@ -0,0 +1,67 @@
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Tuple
+
+from discord import Client, User
+
+from config import CONFIG
+from ratelimit import SCHEDULER, Priority
+
+
+class UserCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache: 'OrderedDict[int, Tuple[float, User]]' = OrderedDict()
+        self._pending: Dict[int, asyncio.Task] = {}
+
+    async def resolve(
+        self,
+        client: Client,
+        user_id: int,
+        *,
+        priority: Priority = Priority.REPORT,
+    ) -> User:
+        user = client.get_user(user_id)
+        if user is not None:
+            self.hits += 1
+            return user
+
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] > monotonic():
+            self._cache.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+        # Concurrent lookups for the same ID share one request
+        task = self._pending.get(user_id)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(
+                self._fetch(client, user_id, priority)
+            )
+            self._pending[user_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(user_id))
+        else:
+            self.hits += 1
+
+        return await asyncio.shield(task)
+
+    async def _fetch(
+        self, client: Client, user_id: int, priority: Priority
+    ) -> User:
+        async with SCHEDULER.slot(priority):
+            user = await client.fetch_user(user_id)
+
+        self._cache[user_id] = (monotonic() + self.ttl, user)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+        return user
+
+
+USERS = UserCache(CONFIG.users.cache_size, CONFIG.users.cache_ttl)
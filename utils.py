@@ -1,11 +1,16 @@
+import asyncio
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
-from discord import Client, Color, Embed, Guild, Member, User
-from discord.errors import Forbidden, NotFound
+from discord import Client, Color, Embed, Guild, User
+from discord.errors import Forbidden, HTTPException, NotFound
 from discord_slash.model import ButtonStyle, SlashCommandPermissionType
-from discord_slash.utils.manage_commands import create_permission
+from discord_slash.utils.manage_commands import (
+    create_choice,
+    create_permission,
+)
 from discord_slash.utils.manage_components import (
     create_actionrow,
     create_button,
@@ -14,10 +19,30 @@ from discord_slash.utils.manage_components import (
 )
 from loguru import logger
 
+from blocklist import BLOCKLIST
+from cluster import CLUSTER
 from config import CONFIG
-from database import Block
+from database import Block, insert_blocks, save
+from logdigest import EMBED_DESCRIPTION_LIMIT, LOGS, chunk_lines
+from modlog import MODLOG, block_event
+from propagation import find_targets
+from ratelimit import SCHEDULER, Backpressure, Priority
+from stats import STATS
+from users import USERS
+
+
+@lru_cache(maxsize=1)
+def reason_options(reasons: Tuple[Tuple[str, str], ...]) -> List[Dict]:
+    return [
+        create_select_option(title, value=value) for value, title in reasons
+    ]
 
-REASONS_DICT = dict(CONFIG.reasons)
+
+def reason_choices() -> List[Dict]:
+    return [
+        create_choice(name=title, value=value)
+        for value, title in CONFIG.reasons
+    ]
 
 
 def make_report_actionrows(
@@ -26,10 +51,7 @@ def make_report_actionrows(
     return [
         create_actionrow(
             create_select(
-                options=[
-                    create_select_option(title, value=value)
-                    for value, title in CONFIG.reasons
-                ],
+                options=reason_options(CONFIG.reasons),
                 placeholder='Global block',
                 min_values=1,
                 max_values=1,
@@ -83,41 +105,30 @@ class Permissions(Enum):
     }
 
 
-async def send_report_embed(
-    client: Client,
-    *,
-    reported: Member,
-    reporter: Member,
-    reason: str,
-    timestamp: datetime,
-    report_id: str,
-    message: bool = False,
-):
-    channel = client.get_channel(CONFIG.server.channels.reports)
-
+async def notify_blocked_user(user: User, reason: str):
     embed = Embed(
-        title='New report',
-        color=Color.gold(),
-        timestamp=timestamp.replace(tzinfo=timezone.utc),
-    )
-    embed.add_field(
-        name='Reported', value=format_user_info(reported), inline=False
-    )
-    embed.add_field(
-        name='Reporter', value=format_user_info(reporter), inline=False
+        title='Global block created',
+        description="Due to a violation of Discord's rules, you've been "
+        'globally banned from all servers Blockbot is in and reported to '
+        "Discord's Trust & Safety team.",
+        color=Color.dark_red(),
     )
+
+    embed.add_field(name='Reason', value=CONFIG.reason_titles[reason])
     embed.add_field(
-        name='Reported message' if message else 'Reason',
-        value=reason,
-        inline=False,
+        name='Appeal',
+        value=f'https://discord.gg/{CONFIG.server.appeals_invite}',
     )
-    embed.set_footer(text=report_id)
 
-    await channel.send(
-        '@here',
-        embed=embed,
-        components=make_report_actionrows(report_id),
-    )
+    embed.set_footer(text=f'User ID: {user.id}')
+
+    # Sent with the bans' priority since it has to arrive before them: once
+    # the user shares no guild with the bot, Discord refuses the DM
+    try:
+        async with SCHEDULER.slot(Priority.BAN):
+            await user.send(embed=embed)
+    except (Forbidden, HTTPException):
+        logger.warning(f'Failed to send message to {user}')
 
 
 async def create_block(
@@ -128,33 +139,30 @@ async def create_block(
         reason=reason,
         moderator_id=moderator_id,
     )
-    block.save()
-
-    user = await client.fetch_user(user_id)
-    moderator = await client.fetch_user(moderator_id)
-
-    embed = Embed(
-        title='Global block created',
-        description="Due to a violation of Discord's rules, you've been "
-        'globally banned from all servers Blockbot is in and reported to '
-        "Discord's Trust & Safety team.",
-        color=Color.dark_red(),
-    )
-
-    embed.add_field(name='Reason', value=REASONS_DICT[reason])
-    embed.add_field(
-        name='Appeal',
-        value=f'https://discord.gg/{CONFIG.server.appeals_invite}',
+    await save(block)
+    BLOCKLIST.add(user_id)
+    STATS.record_block(reason)
+    MODLOG.record(
+        [
+            block_event(
+                user_id=user_id,
+                reason=reason,
+                moderator_id=moderator_id,
+                timestamp=block.timestamp,
+            )
+        ]
     )
 
-    embed.set_footer(text=f'User ID: {user_id}')
+    user = await USERS.resolve(client, user_id)
+    await notify_blocked_user(user, reason)
 
-    try:
-        await user.send(embed=embed)
-    except Forbidden:
-        logger.warning(f'Failed to send message to {user}')
+    # Bans go out before the log, which waits behind other traffic
+    await CLUSTER.publish([user_id])
+    targets = await find_targets(client, [user_id])
+    queued = await client.ban_queue.enqueue(targets)
+    logger.info(f'Queued {queued} bans for block of {user_id}')
 
-    channel = client.get_channel(CONFIG.server.channels.block_logs)
+    moderator = await USERS.resolve(client, moderator_id)
 
     embed = Embed(
         title='New block',
@@ -163,50 +171,132 @@ async def create_block(
     )
     embed.add_field(name='User', value=format_user_info(user))
     embed.add_field(name='Moderator', value=format_user_info(moderator))
-    embed.add_field(name='Reason', value=REASONS_DICT[reason])
+    embed.add_field(name='Reason', value=CONFIG.reason_titles[reason])
 
-    block_alert = await channel.send(embed=embed)
-    await block_alert.publish()
+    LOGS.post(
+        client,
+        CONFIG.server.channels.block_logs,
+        group='New blocks',
+        embed=embed,
+        line=f'{user.mention} `{user}` (`{user.id}`) for '
+        f'{CONFIG.reason_titles[reason]} by {moderator.mention}',
+        publish=True,
+    )
 
-    for guild in client.guilds:
-        if guild.id not in CONFIG.noban_servers:
-            try:
-                member = await guild.fetch_member(user_id)
-                await ban_user(client, guild, member)
-            except NotFound:
-                continue
+    return block
 
 
-async def ban_user(client: Client, guild: Guild, user: Member):
-    block = Block.objects.get(user_id=user.id)   # pylint: disable=no-member
+async def resolve_users(
+    client: Client, user_ids: List[str]
+) -> Tuple[List[User], List[str]]:
+    async def resolve(user_id: str) -> Optional[User]:
+        try:
+            return await USERS.resolve(client, int(user_id))
+        except (ValueError, NotFound):
+            return None
 
-    moderator = client.get_user(block.moderator_id)
+    results = await asyncio.gather(*(resolve(user_id) for user_id in user_ids))
 
-    logger.debug(f'Banning {user} from {guild}')
+    users = {}
+    failed = []
+    for user_id, user in zip(user_ids, results):
+        if user is None:
+            failed.append(user_id)
+        else:
+            users[user.id] = user
 
-    await guild.ban(
-        user,
-        reason=f'Global block by {moderator} ({moderator.id})\n\n'
-        f'{REASONS_DICT[block.reason]}',
-    )
+    return list(users.values()), failed
 
-    embed = Embed(
-        title=f'Banned from {guild.name}',
-        description='You were banned from this server due to your global block'
-        " for violating Discord's rules.",
+
+async def create_blocks(
+    client: Client, *, users: List[User], reason: str, moderator_id: int
+) -> int:
+    timestamp = datetime.utcnow()
+    fields = {
+        'reason': reason,
+        'moderator_id': moderator_id,
+        'timestamp': timestamp,
+    }
+    inserted = set(await insert_blocks({user.id: fields for user in users}))
+
+    # Users who were already blocked keep their original block, and aren't
+    # counted, notified or logged again
+    new_users = [user for user in users if user.id in inserted]
+    blocks = [Block(user_id=user.id, **fields) for user in new_users]
+    for user in users:
+        BLOCKLIST.add(user.id)
+    STATS.record_block(reason, len(blocks))
+    MODLOG.record(
+        block_event(
+            user_id=block.user_id,
+            reason=reason,
+            moderator_id=moderator_id,
+            timestamp=block.timestamp,
+        )
+        for block in blocks
     )
-    embed.add_field(name='Reason', value=REASONS_DICT[block.reason])
-    embed.add_field(
-        name='Appeal',
-        value=f'https://discord.gg/{CONFIG.server.appeals_invite}',
+
+    await asyncio.gather(
+        *(notify_blocked_user(user, reason) for user in new_users)
     )
 
-    embed.set_footer(text=f'User ID: {user.id}')
+    # Other clusters ban in their own guilds once they see the event
+    user_ids = [user.id for user in users]
+    await CLUSTER.publish(user_ids)
+
+    # Bans go out before the logs, which wait behind other traffic
+    targets = await find_targets(client, user_ids)
+    queued = await client.ban_queue.enqueue(targets)
+    logger.info(f'Queued {queued} bans for mass block of {len(users)} users')
+
+    if not blocks:
+        return queued
+
+    moderator = await USERS.resolve(client, moderator_id)
 
     try:
-        await user.send(embed=embed)
-    except Forbidden:
-        logger.warning(f'Failed to send message to {user}')
+        await send_mass_block_logs(
+            client, new_users, blocks, moderator, reason
+        )
+    except (Backpressure, HTTPException):
+        logger.warning(f'Failed to log mass block of {len(blocks)} users')
+
+    return queued
+
+
+async def send_mass_block_logs(
+    client: Client,
+    users: List[User],
+    blocks: List[Block],
+    moderator: User,
+    reason: str,
+):
+    channel = client.get_channel(CONFIG.server.channels.block_logs)
+    lines = [f'{user.mention} `{user}` (`{user.id}`)' for user in users]
+
+    # One embed per full description rather than one message per user
+    descriptions = chunk_lines(lines, EMBED_DESCRIPTION_LIMIT)
+    for i, description in enumerate(descriptions):
+        embed = Embed(
+            title=f'New mass block ({len(users)} users)',
+            description=description,
+            color=Color.dark_red(),
+            timestamp=blocks[0].timestamp.replace(tzinfo=timezone.utc),
+        )
+        if i == 0:
+            embed.add_field(
+                name='Moderator', value=format_user_info(moderator)
+            )
+            embed.add_field(name='Reason', value=CONFIG.reason_titles[reason])
+
+        async with SCHEDULER.slot(Priority.LOG, channel.id):
+            block_alert = await channel.send(embed=embed)
+        async with SCHEDULER.slot(Priority.LOG, channel.id):
+            await block_alert.publish()
+
+
+def format_guild_line(guild: Guild) -> str:
+    return f'**{guild.name}** (`{guild.id}`) · {guild.member_count} members'
 
 
 def format_user_info(user: User) -> str: